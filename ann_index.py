@@ -0,0 +1,348 @@
+import json
+import math
+import os
+import time
+
+import numpy as np
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k largest scores, best first, without a full sort."""
+    n = scores.shape[0]
+    k = min(k, n)
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    if k < n:
+        idx = np.argpartition(-scores, k - 1)[:k]
+    else:
+        idx = np.arange(n)
+    return idx[np.argsort(-scores[idx], kind="stable")]
+
+
+def top_k_per_column(scores: np.ndarray, k: int):
+    """For an (n_rows, n_queries) score matrix, the top-k rows of each column, best first."""
+    n, m = scores.shape
+    k = min(k, n)
+    if k <= 0:
+        return np.zeros((0, m), dtype=np.int64)
+    if k < n:
+        idx = np.argpartition(-scores, k - 1, axis=0)[:k]
+    else:
+        idx = np.tile(np.arange(n)[:, None], (1, m))
+    order = np.argsort(-np.take_along_axis(scores, idx, axis=0), axis=0, kind="stable")
+    return np.take_along_axis(idx, order, axis=0)
+
+
+def append_rows(arr, rows, buf=None):
+    """`arr` with `rows` appended, in amortised O(len(rows)).
+
+    Returns (result, buf): `result` is the filled part of `buf`, an array
+    with spare rows that doubles when full. Pass both back on the next call
+    to fill the spare rows in place; any other `arr` (after a removal or a
+    load) starts a new buffer.
+    """
+    rows = np.asarray(rows)
+    n, k = len(arr), len(rows)
+    dtype = np.result_type(arr.dtype, rows.dtype)
+    fits = (
+        buf is not None
+        and buf.dtype == dtype
+        and len(buf) >= n + k
+        and arr.base is buf
+        and arr.ctypes.data == buf.ctypes.data
+    )
+    if not fits:
+        buf = np.empty((max(2 * (n + k), 16),) + arr.shape[1:], dtype=dtype)
+        buf[:n] = arr
+    buf[n : n + k] = rows
+    return buf[: n + k], buf
+
+
+def score_rows(matrix, q, block: int = 65536) -> np.ndarray:
+    """`matrix @ q` as float32, upcasting low-precision or memory-mapped rows a block at a time.
+
+    `q` is one vector (result shape (n,)) or a (dim, n_queries) matrix.
+    """
+    if isinstance(matrix, Int8Matrix) or (type(matrix) is np.ndarray and matrix.dtype == np.float32):
+        return matrix @ q
+    out = np.empty((matrix.shape[0],) + q.shape[1:], dtype=np.float32)
+    for s in range(0, matrix.shape[0], block):
+        out[s : s + block] = np.asarray(matrix[s : s + block], dtype=np.float32) @ q
+    return out
+
+
+class Int8Matrix:
+    """Row-wise int8-quantized embeddings: row i is codes[i] * scales[i]."""
+
+    def __init__(self, codes, scales):
+        self.codes = codes
+        self.scales = scales
+
+    @property
+    def shape(self):
+        return self.codes.shape
+
+    def __len__(self):
+        return self.codes.shape[0]
+
+    def __getitem__(self, rows):
+        return Int8Matrix(self.codes[rows], self.scales[rows])
+
+    def __matmul__(self, q, block: int = 65536):
+        out = np.empty((self.codes.shape[0],) + q.shape[1:], dtype=np.float32)
+        for s in range(0, self.codes.shape[0], block):
+            scales = self.scales[s : s + block]
+            if q.ndim == 2:
+                scales = scales[:, None]
+            out[s : s + block] = (np.asarray(self.codes[s : s + block], dtype=np.float32) @ q) * scales
+        return out
+
+
+def quantize_int8(embeddings, block: int = 65536):
+    """Symmetric per-row int8 quantization; returns (codes, scales)."""
+    n, dim = embeddings.shape
+    codes = np.empty((n, dim), dtype=np.int8)
+    scales = np.empty(n, dtype=np.float32)
+    for s in range(0, n, block):
+        x = np.asarray(embeddings[s : s + block], dtype=np.float32)
+        m = np.abs(x).max(axis=1)
+        m[m == 0] = 1
+        scales[s : s + block] = m / 127.0
+        codes[s : s + block] = np.clip(np.rint(x / scales[s : s + block, None]), -127, 127)
+    return codes, scales
+
+
+class ExactSearch:
+    """Brute-force inner product over every row; recall 1.0."""
+
+    name = "exact"
+
+    def params(self):
+        return {"name": self.name}
+
+    def fit(self, embeddings):
+        pass
+
+    def add(self, embs):
+        pass
+
+    def remove(self, keep):
+        pass
+
+    def search(self, embeddings, q, k):
+        """Return (rows, scores) of the top k rows for unit vector `q`."""
+        scores = score_rows(embeddings, q)
+        rows = top_k_indices(scores, k)
+        return rows, scores[rows]
+
+    def search_batch(self, embeddings, queries, k, max_score_bytes: int = 256 * 1024**2):
+        """Top k (rows, scores) per row of `queries`, via matrix-matrix products.
+
+        Queries are scored in groups sized so the (n_rows, group) score
+        matrix stays under `max_score_bytes`.
+        """
+        n = embeddings.shape[0]
+        group = max(1, max_score_bytes // (4 * max(1, n)))
+        out = []
+        for s in range(0, len(queries), group):
+            scores = score_rows(embeddings, np.ascontiguousarray(queries[s : s + group].T))
+            top = top_k_per_column(scores, k)
+            for j in range(scores.shape[1]):
+                rows = top[:, j]
+                out.append((rows, scores[rows, j]))
+        return out
+
+    def save(self, path):
+        pass
+
+    def load(self, path, n_rows):
+        return True
+
+
+class IVFSearch:
+    """Inverted-file index: rows are bucketed by their nearest k-means centroid.
+
+    A query scores the centroids, then only the rows in the `nprobe` best
+    buckets, so cost grows with about nprobe * n / nlist instead of n. Raise
+    `nprobe` for recall, lower it for speed; `nlist` defaults to 4*sqrt(n).
+    Rows added later are assigned to the existing centroids, so refit (via
+    `InMemoryIndex.set_backend`) after the corpus has grown a lot.
+    """
+
+    name = "ivf"
+
+    def __init__(self, nlist: int = None, nprobe: int = 8, train_iters: int = 10, seed: int = 0):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_iters = train_iters
+        self.seed = seed
+        self.centroids = None
+        self.assign = np.zeros(0, dtype=np.int32)
+        self._assign_buf = None
+        self._lists = None
+
+    def params(self):
+        return {"name": self.name, "nlist": self.nlist, "nprobe": self.nprobe}
+
+    def _nearest(self, x, block=16384):
+        out = np.empty(x.shape[0], dtype=np.int32)
+        for s in range(0, x.shape[0], block):
+            out[s : s + block] = np.argmax(np.asarray(x[s : s + block], dtype=np.float32) @ self.centroids.T, axis=1)
+        return out
+
+    def fit(self, embeddings):
+        n = embeddings.shape[0]
+        self._lists = None
+        if n == 0:
+            self.centroids = np.zeros((0, embeddings.shape[1]), dtype=np.float32)
+            self.assign = np.zeros(0, dtype=np.int32)
+            return
+        nlist = min(n, self.nlist or max(1, int(4 * math.sqrt(n))))
+        self.nlist = nlist
+        rng = np.random.default_rng(self.seed)
+        # Spherical k-means on a sample is plenty for bucketing.
+        sample_n = min(n, nlist * 32)
+        sample = np.asarray(embeddings[np.sort(rng.choice(n, sample_n, replace=False))], dtype=np.float32)
+        self.centroids = sample[rng.choice(sample_n, nlist, replace=False)].copy()
+        for _ in range(self.train_iters):
+            labels = self._nearest(sample)
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, labels, sample)
+            counts = np.bincount(labels, minlength=nlist)
+            empty = counts == 0
+            if empty.any():
+                # Re-seed empty buckets from random sample points.
+                sums[empty] = sample[rng.choice(sample_n, int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            norms[norms == 0] = 1
+            self.centroids = (sums / norms).astype(np.float32)
+        self.assign = self._nearest(embeddings)
+
+    def add(self, embs):
+        if self.centroids is None or len(self.centroids) == 0:
+            self.fit(embs)
+            return
+        self.assign, self._assign_buf = append_rows(self.assign, self._nearest(embs), self._assign_buf)
+        self._lists = None
+
+    def remove(self, keep):
+        self.assign = self.assign[keep]
+        self._lists = None
+
+    def _inverted_lists(self):
+        if self._lists is None:
+            order = np.argsort(self.assign, kind="stable")
+            bounds = np.searchsorted(self.assign[order], np.arange(len(self.centroids) + 1))
+            self._lists = (order, bounds)
+        return self._lists
+
+    def search(self, embeddings, q, k):
+        if self.centroids is None or len(self.centroids) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        order, bounds = self._inverted_lists()
+        probe = top_k_indices(self.centroids @ q, self.nprobe)
+        rows = np.concatenate([order[bounds[c] : bounds[c + 1]] for c in probe])
+        scores = score_rows(embeddings[rows], q)
+        best = top_k_indices(scores, k)
+        return rows[best], scores[best]
+
+    def search_batch(self, embeddings, queries, k):
+        # Each query probes its own buckets, so there is no shared product to batch.
+        return [self.search(embeddings, q, k) for q in queries]
+
+    def save(self, path):
+        # Write-then-rename, like the other snapshot files.
+        tmp = path + ".ivf.npz.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, centroids=self.centroids, assign=self.assign)
+        os.replace(tmp, path + ".ivf.npz")
+
+    def load(self, path, n_rows):
+        """Load saved buckets; False if missing or out of step with the index."""
+        try:
+            data = np.load(path + ".ivf.npz")
+        except FileNotFoundError:
+            return False
+        if data["assign"].shape[0] != n_rows:
+            return False
+        self.centroids = data["centroids"]
+        self.assign = data["assign"]
+        self.nlist = len(self.centroids)
+        self._lists = None
+        return True
+
+
+BACKENDS = {"exact": ExactSearch, "ivf": IVFSearch}
+
+
+def make_backend(spec):
+    """Build a backend from a name, a saved params dict, or pass one through."""
+    if spec is None:
+        return ExactSearch()
+    if isinstance(spec, str):
+        return BACKENDS[spec]()
+    if isinstance(spec, dict):
+        params = dict(spec)
+        return BACKENDS[params.pop("name")](**params)
+    return spec
+
+
+def recall_at_k(embeddings, queries, backend, k=10):
+    """Mean fraction of the exact top-k that `backend` also returns."""
+    exact = ExactSearch()
+    hits = 0
+    for q in queries:
+        truth = set(exact.search(embeddings, q, k)[0].tolist())
+        got = set(backend.search(embeddings, q, k)[0].tolist())
+        hits += len(truth & got)
+    return hits / float(k * len(queries))
+
+
+def _synthetic(n, dim, n_clusters, rng):
+    centers = rng.standard_normal((n_clusters, dim)).astype(np.float32)
+    x = centers[rng.integers(0, n_clusters, n)] + 0.5 * rng.standard_normal((n, dim)).astype(np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+if __name__ == "__main__":
+    # recall@k / latency benchmark of IVF against exact search on synthetic data:
+    # python ann_index.py [n_rows] [dim]
+    import sys
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    dim = int(sys.argv[2]) if len(sys.argv) > 2 else 384
+    k = 10
+    rng = np.random.default_rng(0)
+    emb = _synthetic(n, dim, max(16, n // 500), rng)
+    # queries near (but not at) indexed rows, like real questions about the corpus
+    queries = emb[rng.choice(n, 100, replace=False)] + 0.05 * rng.standard_normal((100, dim)).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    results = []
+    exact = ExactSearch()
+    t = time.perf_counter()
+    for q in queries:
+        exact.search(emb, q, k)
+    results.append({"backend": "exact", "recall": 1.0, "ms_per_query": 1000 * (time.perf_counter() - t) / len(queries)})
+
+    ivf = IVFSearch()
+    t = time.perf_counter()
+    ivf.fit(emb)
+    build_s = time.perf_counter() - t
+    for nprobe in (1, 4, 8, 16, 32):
+        ivf.nprobe = nprobe
+        t = time.perf_counter()
+        for q in queries:
+            ivf.search(emb, q, k)
+        ms = 1000 * (time.perf_counter() - t) / len(queries)
+        results.append(
+            {
+                "backend": "ivf",
+                "nlist": ivf.nlist,
+                "nprobe": nprobe,
+                "recall": round(recall_at_k(emb, queries, ivf, k), 4),
+                "ms_per_query": ms,
+                "build_s": build_s,
+            }
+        )
+    print(json.dumps({"n": n, "dim": dim, "k": k, "results": results}, indent=2))
@@ -0,0 +1,487 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# End-to-end benchmark against local stand-ins for Tavily, Ollama and the web:
+#
+#   python benchmark.py [--pages 200] [--pdfs 40] [--llm-latency 0.05] [--with-db] [--out run.json]
+#
+# Three local HTTP servers are started (a Tavily-compatible search API, an
+# Ollama-compatible /api/chat and a site serving synthetic HTML pages and
+# PDFs), the project is pointed at them and at throwaway cache directories
+# through environment variables, and each phase reports its throughput or
+# latency as one JSON document for run-to-run comparison. Project modules
+# are imported only after the environment is set, since config.py reads it
+# at import time.
+
+_VOCAB = (
+    "cordyceps militaris cordycepin adenosine polysaccharide fruiting body mycelium extract "
+    "dose mg/kg assay hplc yield culture substrate strain bioactive antioxidant tumour immune "
+    "market size usd billion forecast cagr revenue share competitors supplier vendor "
+    "manufacturer distributor moq gmp iso certification export wholesale price capsule "
+    "powder study trial patients results analysis growth region china korea india"
+).split()
+_FILLER = "the of and in to a with for on by was is were from that as this at".split()
+
+
+def _sentence(rng, n_words):
+    words = [rng.choice(_VOCAB) if rng.random() < 0.4 else rng.choice(_FILLER) for _ in range(n_words)]
+    return " ".join(words).capitalize() + "."
+
+
+def _paragraphs(seed, n, sentences=6):
+    rng = random.Random(seed)
+    return [" ".join(_sentence(rng, rng.randint(8, 20)) for _ in range(sentences)) for _ in range(n)]
+
+
+def _pdf_escape(s):
+    return s.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(pages):
+    """A minimal uncompressed PDF with one text line per item of each page's list."""
+    objs = [b"<< /Type /Catalog /Pages 2 0 R >>"]
+    kids = " ".join("%d 0 R" % (4 + 2 * i) for i in range(len(pages)))
+    objs.append(("<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(pages))).encode())
+    objs.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    for i, lines in enumerate(pages):
+        objs.append(
+            (
+                "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                "/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (5 + 2 * i)
+            ).encode()
+        )
+        ops = ["BT /F1 9 Tf 11 TL 40 760 Td"] + ["(%s) '" % _pdf_escape(line) for line in lines] + ["ET"]
+        stream = "\n".join(ops).encode("latin-1")
+        objs.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, body in enumerate(objs, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % i + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objs) + 1)
+    for off in offsets:
+        out += b"%010d 00000 n \n" % off
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objs) + 1, xref)
+    return bytes(out)
+
+
+def _pdf_pages(seed, n_pages, lines=60):
+    rng = random.Random(seed)
+    return [[_sentence(rng, 12) for _ in range(lines)] for _ in range(n_pages)]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "bench"
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _send(self, status, body, ctype):
+        self.send_response(status)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+
+class FakeSite:
+    """Synthetic pages at /page/<n>.html linking to PDFs at /pdf/<n>.pdf."""
+
+    def __init__(self, n_pages, n_pdfs, pdf_pages):
+        self.n_pages = n_pages
+        self.n_pdfs = max(1, n_pdfs)
+        self.pdf_pages = pdf_pages
+        self.html_hits = 0
+        self.pdf_bytes = 0
+        self._pdfs = {}
+        self._lock = threading.Lock()
+
+    def pdf_for_page(self, n):
+        return n % self.n_pdfs
+
+    def html(self, n):
+        paras = "".join("<p>%s</p>" % p for p in _paragraphs(n, 12))
+        links = "".join('<a href="/page/%d.html">related</a> ' % ((n * 7 + k) % self.n_pages) for k in range(1, 4))
+        return (
+            "<html><head><title>Synthetic page %d</title></head><body><h1>Cordyceps report %d</h1>"
+            '%s<nav>%s</nav><a href="/pdf/%d.pdf">Full report (PDF)</a></body></html>'
+            % (n, n, paras, links, self.pdf_for_page(n))
+        ).encode("utf-8")
+
+    def pdf(self, name):
+        with self._lock:
+            if name not in self._pdfs:
+                self._pdfs[name] = make_pdf(_pdf_pages(zlib.crc32(name.encode()), self.pdf_pages))
+            return self._pdfs[name]
+
+    def handler(self):
+        site = self
+
+        class Handler(_Handler):
+            def do_GET(self):
+                path = self.path.split("?")[0]
+                if path.startswith("/page/") and path.endswith(".html"):
+                    with site._lock:
+                        site.html_hits += 1
+                    self._send(200, site.html(int(path[6:-5])), "text/html; charset=utf-8")
+                elif path.startswith("/pdf/") and path.endswith(".pdf"):
+                    body = site.pdf(path[5:-4])
+                    with site._lock:
+                        site.pdf_bytes += len(body)
+                    self._send(200, body, "application/pdf")
+                else:
+                    self._send(404, b"not found", "text/plain")
+
+        return Handler
+
+
+class FakeTavily:
+    """Tavily-compatible POST /search returning pages of a FakeSite.
+
+    Results depend only on the query, and are drawn from a shared pool of
+    pages, so overlapping queries return overlapping URLs as they do live.
+    """
+
+    def __init__(self, site, site_url, latency):
+        self.site = site
+        self.site_url = site_url
+        self.latency = latency
+        self.searches = 0
+        self._lock = threading.Lock()
+
+    def results(self, query, max_results):
+        rng = random.Random(zlib.crc32(query.encode("utf-8")))
+        out = []
+        for n in rng.sample(range(self.site.n_pages), min(max_results, self.site.n_pages)):
+            snippet = " ".join(_paragraphs(n, 2))
+            out.append(
+                {
+                    "title": "Synthetic page %d" % n,
+                    "url": "%s/page/%d.html" % (self.site_url, n),
+                    "content": "%s Report: %s/pdf/%d.pdf" % (snippet, self.site_url, self.site.pdf_for_page(n)),
+                    "score": 0.5,
+                }
+            )
+        return out
+
+    def handler(self):
+        fake = self
+
+        class Handler(_Handler):
+            def do_POST(self):
+                req = self._json_body()
+                time.sleep(fake.latency)
+                with fake._lock:
+                    fake.searches += 1
+                query = req.get("query", "")
+                body = {
+                    "query": query,
+                    "results": fake.results(query, int(req.get("max_results", 5))),
+                    "response_time": fake.latency,
+                }
+                self._send(200, json.dumps(body).encode("utf-8"), "application/json")
+
+        return Handler
+
+
+class FakeOllama:
+    """Ollama-compatible POST /api/chat answering after a fixed latency.
+
+    The reply is one flat JSON object carrying every field the research,
+    market and vendor extractors look for, so every record is accepted.
+    """
+
+    def __init__(self, latency, tokens=40):
+        self.latency = latency
+        self.tokens = tokens
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def reply(self, n):
+        return json.dumps(
+            {
+                "title": "Synthetic finding %d" % n,
+                "authors": "A. Author",
+                "year": "2024",
+                "summary": " ".join(["cordycepin"] * self.tokens),
+                "market_size": "USD 1.2 billion",
+                "competitors": "Acme Fungi",
+                "vendor_name": "Vendor %d" % n,
+                "country": "India",
+                "certifications": "GMP",
+            }
+        )
+
+    def handler(self):
+        fake = self
+
+        class Handler(_Handler):
+            def do_POST(self):
+                req = self._json_body()
+                with fake._lock:
+                    fake.calls += 1
+                    n = fake.calls
+                model = req.get("model", "bench")
+                content = fake.reply(n)
+                base = {"model": model, "created_at": "2024-01-01T00:00:00Z"}
+                if not req.get("stream"):
+                    time.sleep(fake.latency)
+                    body = dict(base, message={"role": "assistant", "content": content}, done=True, done_reason="stop")
+                    self._send(200, json.dumps(body).encode("utf-8"), "application/json")
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                pieces = content.split(" ")
+                for i, piece in enumerate(pieces):
+                    time.sleep(fake.latency / len(pieces))
+                    msg = dict(base, message={"role": "assistant", "content": piece + " "}, done=False)
+                    self._chunk(json.dumps(msg).encode("utf-8") + b"\n")
+                done = dict(base, message={"role": "assistant", "content": ""}, done=True, done_reason="stop")
+                self._chunk(json.dumps(done).encode("utf-8") + b"\n")
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _chunk(self, data):
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+
+        return Handler
+
+
+def _serve(handler):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, "http://127.0.0.1:%d" % server.server_address[1]
+
+
+def _percentiles(values):
+    if not values:
+        return {"p50_ms": 0.0, "p99_ms": 0.0}
+    values = sorted(values)
+
+    def pick(q):
+        return round(1000 * values[min(len(values) - 1, int(round(q * (len(values) - 1))))], 3)
+
+    return {"p50_ms": pick(0.50), "p99_ms": pick(0.99)}
+
+
+class _ListWriter:
+    """Pipeline writer that keeps records in memory instead of Postgres."""
+
+    def __init__(self):
+        self.records = []
+
+    def add(self, record):
+        self.records.append(record)
+
+    def flush(self):
+        pass
+
+
+def _configure(workdir, tavily_url, ollama_url, with_db):
+    env = {
+        "TAVILY_API_KEY": "bench",
+        "TAVILY_BASE_URL": tavily_url,
+        "OLLAMA_HOST": ollama_url,
+        "HTTP_CACHE_DIR": os.path.join(workdir, "http"),
+        "PDF_STORE_DIR": os.path.join(workdir, "pdfs"),
+        "PDF_MANIFEST_PATH": os.path.join(workdir, "pdfs", "manifest.sqlite"),
+        "PDF_TEXT_CACHE_DIR": os.path.join(workdir, "pdf_text"),
+        "LLM_CACHE_PATH": os.path.join(workdir, "llm.sqlite"),
+        "EMBED_CACHE_PATH": os.path.join(workdir, "embeddings.sqlite"),
+        "QA_CACHE_PATH": os.path.join(workdir, "qa.sqlite"),
+        "SEARCH_CACHE_PATH": os.path.join(workdir, "search.sqlite"),
+        # the stand-in has no rate limit; measure the pipeline, not the bucket
+        "SEARCH_RATE": "0",
+        "METRICS_DIR": os.path.join(workdir, "metrics"),
+    }
+    os.environ.update(env)
+    if not with_db:
+        # keeps config.py from prompting for a password it will not use
+        os.environ.setdefault("DB_PASSWORD", "unused")
+
+
+def bench_pipeline(fake_ollama, site, with_db):
+    """Research, market and vendor engines through one pipeline, as main.main runs them."""
+    calls_before = fake_ollama.calls
+    hits_before = site.html_hits
+    start = time.perf_counter()
+    if with_db:
+        import main
+
+        main.main()
+        stats = {"pages": site.html_hits - hits_before}
+    else:
+        from db import UrlRegistry
+        from main import research_spec
+        from market_engine import market_spec
+        from supplier_engine import vendor_spec
+        from pipeline import Pipeline
+
+        registry = UrlRegistry()
+        registry.loaded = True
+        writer = _ListWriter()
+        product = "Cordyceps militaris"
+        specs = [research_spec(product), market_spec(product), vendor_spec(product)]
+        stats = asyncio.run(Pipeline(writer=writer, registry=registry).run(specs))
+        stats["records"] = len(writer.records)
+    elapsed = time.perf_counter() - start
+    llm_calls = fake_ollama.calls - calls_before
+    stats.pop("elapsed_s", None)
+    return dict(
+        stats,
+        elapsed_s=round(elapsed, 3),
+        llm_calls=llm_calls,
+        pages_per_s=round(stats.get("pages", 0) / elapsed, 3),
+        llm_calls_per_s=round(llm_calls / elapsed, 3),
+    )
+
+
+def bench_pdfs(site_url, n_pdfs):
+    """Download `n_pdfs` distinct PDFs, then extract their text."""
+    from pdf_pipeline import fetch_pdfs, iter_corpus_pages
+
+    urls = ["%s/pdf/bulk-%d.pdf" % (site_url, i) for i in range(n_pdfs)]
+    start = time.perf_counter()
+    results = fetch_pdfs(urls, tag="bench")
+    download_s = time.perf_counter() - start
+    ok = [r for r in results if r.ok]
+    nbytes = sum(r.bytes for r in ok)
+
+    start = time.perf_counter()
+    pages = sum(1 for _ in iter_corpus_pages([r.path for r in ok]))
+    extract_s = time.perf_counter() - start
+    return {
+        "pdfs": len(ok),
+        "failed": len(results) - len(ok),
+        "mb": round(nbytes / 1e6, 3),
+        "download_s": round(download_s, 3),
+        "download_mb_per_s": round(nbytes / 1e6 / download_s, 3) if download_s else 0.0,
+        "pages": pages,
+        "extract_s": round(extract_s, 3),
+        "extract_pages_per_s": round(pages / extract_s, 3) if extract_s else 0.0,
+    }
+
+
+def bench_index(n_questions, seed=0):
+    """Build an index over every stored PDF, then time retrieval and QA."""
+    from embed_index import InMemoryIndex, iter_corpus_chunks
+    from llama_qa import LlamaQA
+    from pdf_pipeline import iter_corpus_pages
+    from pdf_store import get_store
+
+    start = time.perf_counter()
+    idx = InMemoryIndex()
+    model_load_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    n_chunks = idx.add_chunks(iter_corpus_chunks(iter_corpus_pages(get_store().paths()), chunk_size=500, overlap=100))
+    build_s = time.perf_counter() - start
+
+    rng = random.Random(seed)
+    questions = ["What does the study say about %s and %s?" % (rng.choice(_VOCAB), rng.choice(_VOCAB)) for _ in range(n_questions)]
+    out = {"chunks": n_chunks, "model_load_s": round(model_load_s, 3), "build_s": round(build_s, 3)}
+    for name, hybrid in (("dense", False), ("hybrid", True)):
+        latencies = []
+        for q in questions:
+            t = time.perf_counter()
+            idx.query(q, top_k=5, hybrid=hybrid)
+            latencies.append(time.perf_counter() - t)
+        out["query_" + name] = _percentiles(latencies)
+
+    start = time.perf_counter()
+    idx.query_batch(questions, top_k=5, hybrid=True)
+    out["query_batch_ms_per_question"] = round(1000 * (time.perf_counter() - start) / max(1, len(questions)), 3)
+
+    qa = LlamaQA(idx, answer_cache=False)
+    latencies = []
+    for q in questions[: max(1, n_questions // 5)]:
+        t = time.perf_counter()
+        qa.answer(q)
+        latencies.append(time.perf_counter() - t)
+    out["answer"] = _percentiles(latencies)
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="End-to-end benchmark against local stand-ins.")
+    parser.add_argument("--pages", type=int, default=200, help="synthetic pages search results draw from")
+    parser.add_argument("--pdfs", type=int, default=40, help="PDFs downloaded and indexed in the PDF phase")
+    parser.add_argument("--pdf-pages", type=int, default=8, help="pages per synthetic PDF")
+    parser.add_argument("--search-latency", type=float, default=0.05, help="fake Tavily latency (s)")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="fake Ollama latency (s)")
+    parser.add_argument("--questions", type=int, default=100, help="retrieval questions timed")
+    parser.add_argument("--phases", default="pipeline,pdf,index", help="comma-separated phases to run")
+    parser.add_argument("--with-db", action="store_true", help="run main.main() against the configured Postgres")
+    parser.add_argument("--out", help="also write the JSON report to this file")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary cache directory")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args(argv)
+
+    site = FakeSite(args.pages, max(1, args.pages // 5), args.pdf_pages)
+    site_server, site_url = _serve(site.handler())
+    tavily = FakeTavily(site, site_url, args.search_latency)
+    tavily_server, tavily_url = _serve(tavily.handler())
+    ollama = FakeOllama(args.llm_latency)
+    ollama_server, ollama_url = _serve(ollama.handler())
+
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    _configure(workdir, tavily_url, ollama_url, args.with_db)
+    logging.basicConfig(level=args.log_level)
+    logging.getLogger().setLevel(args.log_level)
+
+    phases = [p.strip() for p in args.phases.split(",") if p.strip()]
+    report = {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "keep", "log_level")},
+    }
+    try:
+        if "pipeline" in phases:
+            report["pipeline"] = bench_pipeline(ollama, site, args.with_db)
+            report["pipeline"]["searches_served"] = tavily.searches
+        if "pdf" in phases:
+            report["pdf"] = bench_pdfs(site_url, args.pdfs)
+        if "index" in phases:
+            report["index"] = bench_index(args.questions)
+        import metrics
+
+        # per-stage timings and counters from the instrumented code paths
+        report["stages"] = metrics.get_registry().summary()
+    finally:
+        for server in (site_server, tavily_server, ollama_server):
+            server.shutdown()
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+        else:
+            report["workdir"] = workdir
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+import hashlib
+import json
+import math
+import os
+import re
+from collections import Counter, defaultdict
+from typing import Dict, List
+
+import numpy as np
+
+# Runs of letters/digits, kept whole across . / - so DOIs ("10.3390/foods10112634")
+# and compound names ("3'-deoxyadenosine" -> "3", "deoxyadenosine") stay matchable.
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[./-][a-z0-9]+)*")
+_SPLIT_RE = re.compile(r"[./-]")
+
+# Files written by BM25Index.save next to an index snapshot; ".bm25.json" is
+# written last and marks the set complete.
+SAVED_SUFFIXES = (
+    ".bm25.terms.npy",
+    ".bm25.offsets.npy",
+    ".bm25.ids.npy",
+    ".bm25.tfs.npy",
+    ".bm25.docs.npy",
+    ".bm25.json",
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased terms; compound tokens are also indexed by their parts."""
+    out = []
+    for tok in _TOKEN_RE.findall(text.lower()):
+        out.append(tok)
+        if _SPLIT_RE.search(tok):
+            out.extend(p for p in _SPLIT_RE.split(tok) if p)
+    return out
+
+
+def term_hash(term: str) -> int:
+    """64-bit key a term is stored under in a saved index."""
+    return int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def _save_npy(path, arr):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        np.save(f, arr)
+    os.replace(tmp, path)
+
+
+class _Saved:
+    """A saved index as CSR arrays (memory-mapped when loaded that way).
+
+    `terms` holds the sorted term hashes and `offsets[i]:offsets[i + 1]`
+    the slice of `ids`/`tfs` (chunk id, term frequency) posted under
+    terms[i]; `docs` is (chunk id, length) rows sorted by chunk id.
+    """
+
+    def __init__(self, terms, offsets, ids, tfs, docs):
+        self.terms = terms
+        self.offsets = offsets
+        self.ids = ids
+        self.tfs = tfs
+        self.docs = docs
+
+    def row_of_doc(self, cid):
+        i = int(np.searchsorted(self.docs[:, 0], cid))
+        return i if i < len(self.docs) and self.docs[i, 0] == cid else -1
+
+    def term(self, h):
+        """(chunk ids, tfs) posted under term hash `h`."""
+        i = int(np.searchsorted(self.terms, np.uint64(h)))
+        if i >= len(self.terms) or self.terms[i] != h:
+            return None
+        s, e = self.offsets[i], self.offsets[i + 1]
+        return self.ids[s:e], self.tfs[s:e]
+
+    def doc_lens(self, ids):
+        return self.docs[np.searchsorted(self.docs[:, 0], ids), 1]
+
+
+class BM25Index:
+    """Okapi BM25 inverted index over chunks, keyed by chunk id.
+
+    A loaded index is not rebuilt into Python objects: it is searched in
+    place from its CSR arrays (see `_Saved`), so loading costs a few file
+    opens. Chunks added afterwards go into in-memory postings, and removed
+    saved chunks are masked out, until the next `save` merges everything.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        # in-memory part: chunks added since the last load
+        self.postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        self.doc_len: Dict[int, int] = {}
+        self._total_len = 0
+        self._saved = None
+        self._removed = set()
+
+    def __len__(self):
+        n = len(self.doc_len)
+        if self._saved is not None:
+            n += len(self._saved.docs) - len(self._removed)
+        return n
+
+    def add(self, chunk_ids, texts):
+        for cid, text in zip(chunk_ids, texts):
+            cid = int(cid)
+            terms = Counter(tokenize(text))
+            for term, tf in terms.items():
+                self.postings[term][cid] = tf
+            n = sum(terms.values())
+            self.doc_len[cid] = n
+            self._total_len += n
+
+    def remove(self, chunk_ids, texts):
+        for cid, text in zip(chunk_ids, texts):
+            cid = int(cid)
+            if cid in self.doc_len:
+                for term in set(tokenize(text)):
+                    p = self.postings.get(term)
+                    if p is not None:
+                        p.pop(cid, None)
+                        if not p:
+                            del self.postings[term]
+                self._total_len -= self.doc_len.pop(cid)
+            elif self._saved is not None and cid not in self._removed:
+                row = self._saved.row_of_doc(cid)
+                if row >= 0:
+                    self._removed.add(cid)
+                    self._total_len -= int(self._saved.docs[row, 1])
+
+    def _term_postings(self, term):
+        """(chunk ids, tfs, doc lengths) of every live chunk containing `term`."""
+        ids, tfs, lens = [], [], []
+        if self._saved is not None:
+            hit = self._saved.term(term_hash(term))
+            if hit is not None:
+                s_ids, s_tfs = hit
+                if self._removed:
+                    keep = ~np.isin(s_ids, np.fromiter(self._removed, dtype=np.int64, count=len(self._removed)))
+                    s_ids, s_tfs = s_ids[keep], s_tfs[keep]
+                ids.append(np.asarray(s_ids))
+                tfs.append(np.asarray(s_tfs))
+                lens.append(self._saved.doc_lens(s_ids))
+        p = self.postings.get(term)
+        if p:
+            ids.append(np.fromiter(p.keys(), dtype=np.int64, count=len(p)))
+            tfs.append(np.fromiter(p.values(), dtype=np.int64, count=len(p)))
+            lens.append(np.fromiter((self.doc_len[c] for c in p), dtype=np.int64, count=len(p)))
+        if not ids:
+            return None
+        return np.concatenate(ids), np.concatenate(tfs), np.concatenate(lens)
+
+    def search(self, query: str, k: int = 10):
+        """Return [(chunk_id, score)] for the k best-scoring chunks."""
+        n = len(self)
+        if not n:
+            return []
+        avgdl = self._total_len / n
+        all_ids, all_scores = [], []
+        for term in set(tokenize(query)):
+            hit = self._term_postings(term)
+            if hit is None or not len(hit[0]):
+                continue
+            ids, tfs, lens = hit
+            df = len(ids)
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            tfs = tfs.astype(np.float64)
+            norm = tfs + self.k1 * (1 - self.b + self.b * lens / avgdl)
+            all_ids.append(ids)
+            all_scores.append(idf * tfs * (self.k1 + 1) / norm)
+        if not all_ids:
+            return []
+        ids, inverse = np.unique(np.concatenate(all_ids), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(all_scores))
+        k = min(k, len(ids))
+        # every candidate scoring at least the k-th best, ties broken by chunk id
+        kth = scores[np.argpartition(-scores, k - 1)[k - 1]]
+        top = np.flatnonzero(scores >= kth)
+        top = top[np.lexsort((ids[top], -scores[top]))][:k]
+        return [(int(ids[i]), float(scores[i])) for i in top]
+
+    def _arrays(self):
+        """All live postings as (term hashes, chunk ids, tfs) and docs as (ids, lens)."""
+        hashes, ids, tfs, doc_ids, doc_lens = [], [], [], [], []
+        if self._saved is not None:
+            s = self._saved
+            p_ids = np.asarray(s.ids)
+            p_hashes = np.repeat(np.asarray(s.terms), np.diff(np.asarray(s.offsets)))
+            p_tfs = np.asarray(s.tfs)
+            d_ids, d_lens = np.asarray(s.docs[:, 0]), np.asarray(s.docs[:, 1])
+            if self._removed:
+                removed = np.fromiter(self._removed, dtype=np.int64, count=len(self._removed))
+                keep = ~np.isin(p_ids, removed)
+                p_hashes, p_ids, p_tfs = p_hashes[keep], p_ids[keep], p_tfs[keep]
+                keep = ~np.isin(d_ids, removed)
+                d_ids, d_lens = d_ids[keep], d_lens[keep]
+            hashes.append(p_hashes)
+            ids.append(p_ids)
+            tfs.append(p_tfs)
+            doc_ids.append(d_ids)
+            doc_lens.append(d_lens)
+        for term, p in self.postings.items():
+            hashes.append(np.full(len(p), term_hash(term), dtype=np.uint64))
+            ids.append(np.fromiter(p.keys(), dtype=np.int64, count=len(p)))
+            tfs.append(np.fromiter(p.values(), dtype=np.int32, count=len(p)))
+        doc_ids.append(np.fromiter(self.doc_len.keys(), dtype=np.int64, count=len(self.doc_len)))
+        doc_lens.append(np.fromiter(self.doc_len.values(), dtype=np.int64, count=len(self.doc_len)))
+
+        def cat(parts, dtype):
+            return np.concatenate(parts).astype(dtype, copy=False) if parts else np.zeros(0, dtype)
+
+        return (
+            cat(hashes, np.uint64),
+            cat(ids, np.int64),
+            cat(tfs, np.int32),
+            cat(doc_ids, np.int64),
+            cat(doc_lens, np.int64),
+        )
+
+    def save(self, path: str):
+        """Write the index next to `path` as CSR arrays (see SAVED_SUFFIXES)."""
+        hashes, ids, tfs, doc_ids, doc_lens = self._arrays()
+        # stable, so each term keeps saved postings first, then added ones
+        order = np.argsort(hashes, kind="stable")
+        hashes, ids, tfs = hashes[order], ids[order], tfs[order]
+        first = np.ones(len(hashes), dtype=bool)
+        first[1:] = hashes[1:] != hashes[:-1]
+        starts = np.flatnonzero(first)
+        offsets = np.append(starts, len(hashes)).astype(np.int64)
+        order = np.argsort(doc_ids, kind="stable")
+        _save_npy(path + ".bm25.terms.npy", hashes[starts])
+        _save_npy(path + ".bm25.offsets.npy", offsets)
+        _save_npy(path + ".bm25.ids.npy", ids)
+        _save_npy(path + ".bm25.tfs.npy", tfs)
+        _save_npy(path + ".bm25.docs.npy", np.stack([doc_ids[order], doc_lens[order]], axis=1))
+        tmp = path + ".bm25.json.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(
+                {"version": 2, "k1": self.k1, "b": self.b, "n_docs": len(doc_ids), "total_len": int(doc_lens.sum())}, f
+            )
+        os.replace(tmp, path + ".bm25.json")
+        try:
+            # format before version 2
+            os.remove(path + ".bm25.npz")
+        except FileNotFoundError:
+            pass
+
+    def load(self, path: str, n_chunks: int, mmap: bool = True) -> bool:
+        """Load a saved index; False if missing or out of step with the dense index."""
+        try:
+            with open(path + ".bm25.json", "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return False
+        if meta.get("n_docs") != n_chunks:
+            return False
+        mode = "r" if mmap else None
+        self._saved = _Saved(*(np.load(path + ext, mmap_mode=mode) for ext in SAVED_SUFFIXES[:5]))
+        self.k1, self.b = float(meta["k1"]), float(meta["b"])
+        self.postings = defaultdict(dict)
+        self.doc_len = {}
+        self._removed = set()
+        self._total_len = int(meta["total_len"])
+        return True
+
+
+def reciprocal_rank_fusion(rankings, k: int = 60):
+    """Fuse ranked lists of ids: score(id) = sum over lists of 1 / (k + rank)."""
+    fused = defaultdict(float)
+    for ranking in rankings:
+        for rank, cid in enumerate(ranking, start=1):
+            fused[cid] += 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda kv: -kv[1])
@@ -7,13 +7,92 @@ load_dotenv()
 
 # Read configuration from environment; avoid hard-coded secrets.
 TAVILY_API_KEY = os.getenv("TAVILY_API_KEY")
+# Alternative Tavily API endpoint, e.g. benchmark.py's local stand-in.
+TAVILY_BASE_URL = os.getenv("TAVILY_BASE_URL")
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3")
+# Ollama server address; None lets the ollama client use its default.
+OLLAMA_HOST = os.getenv("OLLAMA_HOST")
 DB_NAME = os.getenv("DB_NAME", "cordyceps_intel")
 DB_USER = os.getenv("DB_USER", "postgres")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
 DB_HOST = os.getenv("DB_HOST", "localhost")
 DB_PORT = os.getenv("DB_PORT", "5432")
 
+# Per-stage concurrency limits for the async research pipeline (pipeline.py).
+SEARCH_CONCURRENCY = int(os.getenv("SEARCH_CONCURRENCY", "4"))
+FETCH_CONCURRENCY = int(os.getenv("FETCH_CONCURRENCY", "8"))
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "2"))
+DB_CONCURRENCY = int(os.getenv("DB_CONCURRENCY", "1"))
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "64"))
+
+# Postgres connection pool and buffered writer (db.py).
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "8"))
+DB_BATCH_SIZE = int(os.getenv("DB_BATCH_SIZE", "100"))
+DB_FLUSH_INTERVAL = float(os.getenv("DB_FLUSH_INTERVAL", "5"))
+DB_FLUSH_RETRIES = int(os.getenv("DB_FLUSH_RETRIES", "3"))
+# Seconds before the first retry when close() finds the database down; doubles each time.
+DB_FLUSH_BACKOFF = float(os.getenv("DB_FLUSH_BACKOFF", "1"))
+# Rows per server-side cursor fetch when reading (db.iter_intelligence).
+DB_FETCH_SIZE = int(os.getenv("DB_FETCH_SIZE", "1000"))
+# Rows per server-side cursor fetch when exporting (report_generator.py).
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "5000"))
+
+# Shared Tavily search service (search_service.py): cached results per
+# normalised query, and a token bucket of SEARCH_RATE calls/s (SEARCH_BURST at once).
+SEARCH_CACHE_PATH = os.getenv("SEARCH_CACHE_PATH", ".cache/search.sqlite")
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", str(24 * 3600)))
+SEARCH_RATE = float(os.getenv("SEARCH_RATE", "2"))
+SEARCH_BURST = int(os.getenv("SEARCH_BURST", "4"))
+
+# On-disk HTTP cache for scraped pages (http_cache.py).
+HTTP_CACHE_DIR = os.getenv("HTTP_CACHE_DIR", ".cache/http")
+HTTP_CACHE_TTL = float(os.getenv("HTTP_CACHE_TTL", "3600"))
+HTTP_CACHE_MAX_BYTES = int(os.getenv("HTTP_CACHE_MAX_BYTES", str(2 * 1024**3)))
+
+# Scraped HTML pages (main.scrape): bytes read per page, characters of text kept.
+PAGE_MAX_BYTES = int(os.getenv("PAGE_MAX_BYTES", str(2 * 1024**2)))
+PAGE_MAX_CHARS = int(os.getenv("PAGE_MAX_CHARS", "20000"))
+
+# PDF downloads (pdf_pipeline.py).
+PDF_DOWNLOAD_WORKERS = int(os.getenv("PDF_DOWNLOAD_WORKERS", "4"))
+PDF_MAX_BYTES = int(os.getenv("PDF_MAX_BYTES", str(100 * 1024**2)))
+PDF_STORE_DIR = os.getenv("PDF_STORE_DIR", "pdfs/store")
+PDF_MANIFEST_PATH = os.getenv("PDF_MANIFEST_PATH", "pdfs/manifest.sqlite")
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+PDF_TEXT_CACHE_DIR = os.getenv("PDF_TEXT_CACHE_DIR", ".cache/pdf_text")
+
+# Embedding index (embed_index.py).
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", ".cache/embeddings.sqlite")
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "128"))
+
+# Persistent cache of LLM extraction responses (llm_cache.py).
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", ".cache/llm_extract.sqlite")
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(256 * 1024**2)))
+
+# Shared LLM request scheduler (llm_client.py).
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "2"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", "2"))
+LLM_RETRY_BACKOFF = float(os.getenv("LLM_RETRY_BACKOFF", "1"))
+
+# Question answering (llama_qa.py). The context budget counts whitespace
+# tokens, like embed_index.chunk_text.
+QA_CONTEXT_TOKENS = int(os.getenv("QA_CONTEXT_TOKENS", "1500"))
+QA_CACHE_PATH = os.getenv("QA_CACHE_PATH", ".cache/qa_answers.sqlite")
+
+# Resident QA server (qa_server.py); llama_qa.py's CLI talks to it when it is up.
+QA_INDEX_PATH = os.getenv("QA_INDEX_PATH", "data/emb_index")
+QA_SERVER_HOST = os.getenv("QA_SERVER_HOST", "127.0.0.1")
+QA_SERVER_PORT = int(os.getenv("QA_SERVER_PORT", "8765"))
+QA_RELOAD_INTERVAL = float(os.getenv("QA_RELOAD_INTERVAL", "5"))
+
+# Per-stage timing and counters (metrics.py): a JSON summary per run in
+# METRICS_DIR, plus a Prometheus textfile when METRICS_PROM_PATH is set.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") not in ("0", "false", "no")
+METRICS_DIR = os.getenv("METRICS_DIR", "metrics")
+METRICS_PROM_PATH = os.getenv("METRICS_PROM_PATH")
+
 # If password not provided via env, prompt interactively when possible.
 if not DB_PASSWORD:
 	if sys.stdin.isatty():
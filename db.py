@@ -1,6 +1,74 @@
+import atexit
+import json
 import logging
+import re
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from functools import lru_cache
+
 import psycopg2
-from config import DB_NAME, DB_USER, DB_PASSWORD, DB_HOST, DB_PORT
+from psycopg2 import pool
+from psycopg2.extras import Json, execute_values
+from config import (
+    DB_NAME,
+    DB_USER,
+    DB_PASSWORD,
+    DB_HOST,
+    DB_PORT,
+    DB_POOL_MIN,
+    DB_POOL_MAX,
+    DB_BATCH_SIZE,
+    DB_FLUSH_INTERVAL,
+    DB_FLUSH_RETRIES,
+    DB_FLUSH_BACKOFF,
+    DB_FETCH_SIZE,
+)
+import metrics
+
+INTELLIGENCE_COLUMNS = (
+    "source_type",
+    "title",
+    "entity",
+    "year",
+    "country",
+    "summary",
+    "price",
+    "moq",
+    "certifications",
+    "contact_email",
+    "phone",
+    "url",
+    "doi_or_patent",
+)
+
+# Columns identifying a record; a page is stored once per source type.
+INTELLIGENCE_KEY = ("source_type", "url")
+
+# The full record each engine extracted (market_size, competitors,
+# vendor_name, product_line, ...) is also kept in the JSONB `payload` column.
+# It has a GIN index for containment (`payload @> '{"country": "India"}'`)
+# and the expression indexes below for the fields we filter on most.
+PAYLOAD_KEY_FIELDS = ("vendor_name", "country")  # btree on lower(payload->>field)
+PAYLOAD_TEXT_FIELDS = ("certifications", "competitors", "key_players", "product_line")  # trigram, needs pg_trgm
+
+_WRITE_COLUMNS = INTELLIGENCE_COLUMNS + ("payload",)
+
+# `write_txid` (see _init_write_txid) is set by the column default on insert
+# and restamped here when an upsert updates a row.
+_UPSERT_SQL = """
+        INSERT INTO intelligence (%s) VALUES %%s
+        ON CONFLICT (source_type, url) DO UPDATE SET %s, write_txid = txid_current()
+""" % (
+    ", ".join(_WRITE_COLUMNS),
+    ", ".join(
+        "%s = EXCLUDED.%s" % (col, col) for col in _WRITE_COLUMNS if col not in INTELLIGENCE_KEY
+    ),
+)
+
+_pool = None
+_pool_lock = threading.Lock()
 
 
 def get_connection():
@@ -9,14 +77,122 @@ def get_connection():
     )
 
 
+def get_pool():
+    """Return the process-wide connection pool, creating it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = pool.ThreadedConnectionPool(
+                DB_POOL_MIN,
+                max(DB_POOL_MIN, DB_POOL_MAX),
+                dbname=DB_NAME,
+                user=DB_USER,
+                password=DB_PASSWORD,
+                host=DB_HOST,
+                port=DB_PORT,
+            )
+        return _pool
+
+
+@contextmanager
+def pooled_connection():
+    """Borrow a connection from the pool for the duration of the block."""
+    p = get_pool()
+    conn = p.getconn()
+    try:
+        yield conn
+    finally:
+        # The pool rolls back any open transaction; drop broken connections.
+        p.putconn(conn, close=bool(conn.closed))
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+
+
+def _column_value(value):
+    # LLM replies sometimes nest lists/objects where a string is expected;
+    # psycopg2 cannot adapt a dict to TEXT, so store its JSON instead.
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+def _record_row(data):
+    return tuple(_column_value(data.get(col)) for col in INTELLIGENCE_COLUMNS) + (Json(data),)
+
+
+def _payload_field(field):
+    """SQL for lower(payload->>'field'); field names are inlined so the expression indexes apply."""
+    if not re.fullmatch(r"[A-Za-z_][A-Za-z0-9_]*", field):
+        raise ValueError("Invalid payload field: %r" % field)
+    return "lower(payload->>'%s')" % field
+
+
+def _init_payload(cur):
+    """Add the payload column (backfilled from the fixed columns) and its indexes."""
+    cur.execute(
+        "SELECT 1 FROM information_schema.columns "
+        "WHERE table_name = 'intelligence' AND column_name = 'payload';"
+    )
+    if cur.fetchone() is None:
+        cur.execute("ALTER TABLE intelligence ADD COLUMN payload JSONB;")
+        cur.execute(
+            "UPDATE intelligence SET payload = jsonb_strip_nulls(jsonb_build_object(%s));"
+            % ", ".join("'%s', %s" % (col, col) for col in INTELLIGENCE_COLUMNS)
+        )
+        logging.info("Added payload column; backfilled %d rows from fixed columns", cur.rowcount)
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS intelligence_payload_gin "
+        "ON intelligence USING GIN (payload jsonb_path_ops);"
+    )
+    for field in PAYLOAD_KEY_FIELDS:
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS intelligence_payload_%s ON intelligence ((%s));"
+            % (field, _payload_field(field))
+        )
+
+    # Substring search on free-text fields uses trigram indexes when the
+    # pg_trgm extension exists or we may create it; otherwise those filters
+    # fall back to a scan.
+    cur.execute("SAVEPOINT trgm;")
+    try:
+        cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
+    except psycopg2.Error as e:
+        cur.execute("ROLLBACK TO SAVEPOINT trgm;")
+        logging.warning("pg_trgm unavailable (%s); payload text filters will not be indexed", str(e).strip())
+        return
+    cur.execute("RELEASE SAVEPOINT trgm;")
+    for field in PAYLOAD_TEXT_FIELDS:
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS intelligence_payload_%s_trgm "
+            "ON intelligence USING GIN ((%s) gin_trgm_ops);" % (field, _payload_field(field))
+        )
+
+
+def _init_write_txid(cur):
+    """Add `write_txid`, the (64-bit) id of the transaction that last wrote each row.
+
+    Incremental exports (report_generator.py) use it to pick up rows
+    committed since the previous export, whatever their `id`. Rows stored
+    before the column existed keep NULL.
+    """
+    cur.execute("ALTER TABLE intelligence ADD COLUMN IF NOT EXISTS write_txid BIGINT;")
+    cur.execute("ALTER TABLE intelligence ALTER COLUMN write_txid SET DEFAULT txid_current();")
+    cur.execute("CREATE INDEX IF NOT EXISTS intelligence_write_txid ON intelligence (write_txid);")
+
+
 def init_db():
-    conn = None
     try:
-        conn = get_connection()
-        with conn:
-            with conn.cursor() as cur:
-                cur.execute(
-                    """
+        with pooled_connection() as conn:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute(
+                        """
         CREATE TABLE IF NOT EXISTS intelligence (
             id SERIAL PRIMARY KEY,
             source_type TEXT,
@@ -34,66 +210,426 @@ def init_db():
             doi_or_patent TEXT
         );
     """
-                )
+                    )
+                    cur.execute(
+                        "SELECT 1 FROM pg_indexes WHERE tablename = 'intelligence' "
+                        "AND indexname = 'intelligence_source_url_key';"
+                    )
+                    if cur.fetchone() is None:
+                        # Older tables may hold repeated pages; keep the newest
+                        # row of each before adding the unique key.
+                        cur.execute(
+                            """
+        DELETE FROM intelligence a USING intelligence b
+        WHERE a.source_type = b.source_type AND a.url = b.url AND a.id < b.id;
+    """
+                        )
+                        if cur.rowcount:
+                            logging.info("Removed %d duplicate intelligence rows", cur.rowcount)
+                        cur.execute(
+                            "CREATE UNIQUE INDEX intelligence_source_url_key "
+                            "ON intelligence (source_type, url);"
+                        )
+                    _init_payload(cur)
+                    _init_write_txid(cur)
     except Exception:
         logging.exception("Database initialization failed")
         raise
-    finally:
-        if conn:
-            conn.close()
 
 
 def insert_intelligence(data):
-    conn = None
+    """Insert one record, updating the stored row if its page is already known."""
     try:
-        conn = get_connection()
-        with conn:
-            with conn.cursor() as cur:
-                cur.execute(
-                    """
-        INSERT INTO intelligence (
-            source_type, title, entity, year, country,
-            summary, price, moq, certifications,
-            contact_email, phone, url, doi_or_patent
-        ) VALUES (%s, %s, %s, %s, %s,
-                  %s, %s, %s, %s,
-                  %s, %s, %s, %s)
-    """,
-                    (
-                        data.get("source_type"),
-                        data.get("title"),
-                        data.get("entity"),
-                        data.get("year"),
-                        data.get("country"),
-                        data.get("summary"),
-                        data.get("price"),
-                        data.get("moq"),
-                        data.get("certifications"),
-                        data.get("contact_email"),
-                        data.get("phone"),
-                        data.get("url"),
-                        data.get("doi_or_patent"),
-                    ),
-                )
+        with pooled_connection() as conn:
+            with conn:
+                with conn.cursor() as cur:
+                    execute_values(cur, _UPSERT_SQL, [_record_row(data)])
+        known_urls.add(data.get("source_type"), data.get("url"))
     except Exception:
         logging.exception("Failed to insert intelligence record")
         raise
+
+
+def insert_intelligence_many(records):
+    """Upsert many records in one multi-row statement and one commit."""
+    # ON CONFLICT cannot touch the same row twice in one statement, so keep
+    # only the last record for each key.
+    by_key = {}
+    for r in records:
+        by_key[(r.get("source_type"), r.get("url"))] = _record_row(r)
+    rows = list(by_key.values())
+    if not rows:
+        return 0
+    try:
+        with metrics.timer("db_insert"), pooled_connection() as conn:
+            with conn:
+                with conn.cursor() as cur:
+                    execute_values(cur, _UPSERT_SQL, rows, page_size=len(rows))
+    except Exception:
+        logging.exception("Failed to insert %d intelligence records", len(rows))
+        raise
+    metrics.inc("db_rows", len(rows))
+    for source_type, url in by_key:
+        known_urls.add(source_type, url)
+    return len(rows)
+
+
+class UrlRegistry:
+    """In-process set of (source_type, url) pairs that are already stored.
+
+    Engines `claim` a page before scraping or extracting it; a claim fails if
+    the page is in the table or was already claimed earlier in this run, so
+    each page costs at most one scrape and one LLM call.
+    """
+
+    def __init__(self):
+        self._keys = set()
+        self._lock = threading.Lock()
+        self.loaded = False
+
+    def load(self):
+        """(Re)load every stored (source_type, url) from the database."""
+        keys = set()
+        with pooled_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT source_type, url FROM intelligence WHERE url IS NOT NULL;")
+                for row in cur:
+                    keys.add(row)
+        with self._lock:
+            self._keys |= keys
+            self.loaded = True
+        logging.info("Loaded %d known intelligence URLs", len(keys))
+        return len(keys)
+
+    def ensure_loaded(self):
+        if not self.loaded:
+            self.load()
+
+    def add(self, source_type, url):
+        with self._lock:
+            self._keys.add((source_type, url))
+
+    def claim(self, source_type, url):
+        """Return True if the page is new, marking it as seen."""
+        key = (source_type, url)
+        with self._lock:
+            if key in self._keys:
+                return False
+            self._keys.add(key)
+            return True
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._keys
+
+    def __len__(self):
+        return len(self._keys)
+
+
+known_urls = UrlRegistry()
+
+
+class IntelligenceWriter:
+    """Buffers intelligence records and writes them in batches.
+
+    A batch is flushed when `batch_size` records are buffered (in the thread
+    that added the last one) or when the oldest buffered record is older than
+    `flush_interval` seconds (by a background thread). `close()` flushes
+    whatever is left.
+
+    If the batch statement fails, its records are upserted one at a time so
+    a single bad record is logged and dropped instead of the whole batch.
+    If none of them can be written (the database is down), the batch goes
+    back into the buffer and is retried by later flushes, at most
+    `max_retries` times. `close()` waits `backoff` seconds before its first
+    retry, doubling each time, and drops what is still unwritten after
+    that.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = DB_BATCH_SIZE,
+        flush_interval: float = DB_FLUSH_INTERVAL,
+        max_retries: int = DB_FLUSH_RETRIES,
+        backoff: float = DB_FLUSH_BACKOFF,
+    ):
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.max_retries = max(0, max_retries)
+        self.backoff = max(0.0, backoff)
+        self.written = 0
+        self.dropped = 0
+        self._failures = 0
+        self._buffer = []
+        self._oldest = None
+        self._lock = threading.Lock()
+        # Serialises flushes so batches are committed in the order they were cut.
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        if flush_interval and flush_interval > 0:
+            self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+            self._thread.start()
+
+    def add(self, record):
+        with self._lock:
+            if not self._buffer:
+                self._oldest = time.monotonic()
+            self._buffer.append(record)
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self.flush()
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                batch, self._buffer = self._buffer, []
+                self._oldest = None
+            if not batch:
+                return 0
+            try:
+                n = insert_intelligence_many(batch)
+            except Exception:
+                n = self._write_each(batch)
+            self.written += n
+            logging.info("Flushed %d intelligence records to DB", n)
+            return n
+
+    def _write_each(self, batch):
+        """Fallback after a failed batch: upsert record by record."""
+        written = 0
+        failed = []
+        for record in batch:
+            try:
+                insert_intelligence(record)
+                written += 1
+            except Exception:
+                # logged by insert_intelligence
+                failed.append(record)
+        if not failed:
+            self._failures = 0
+            return written
+        if written == 0 and self._failures < self.max_retries:
+            # Nothing went in, so the database itself is failing; keep the
+            # batch (ahead of newer records) for the next flush.
+            self._failures += 1
+            with self._lock:
+                self._buffer[:0] = batch
+                if self._oldest is None:
+                    self._oldest = time.monotonic()
+            logging.warning(
+                "DB write failed; keeping %d records for retry %d/%d", len(batch), self._failures, self.max_retries
+            )
+            return 0
+        self._failures = 0
+        self._drop(failed)
+        return written
+
+    def _drop(self, records):
+        self.dropped += len(records)
+        metrics.inc("db_dropped", len(records))
+        for record in records:
+            logging.error("Dropped intelligence record [%s]: %s", record.get("source_type"), record.get("url"))
+
+    def _run(self):
+        while not self._stop.wait(min(1.0, self.flush_interval)):
+            with self._lock:
+                due = self._oldest is not None and time.monotonic() - self._oldest >= self.flush_interval
+            if due:
+                try:
+                    self.flush()
+                except Exception:
+                    # keep the thread alive; flush logs its own failures
+                    logging.exception("Background flush failed")
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        # A batch kept for retry (the database is down) gets up to
+        # max_retries more attempts, with backoff, instead of a tight loop.
+        delay = self.backoff
+        for _ in range(self.max_retries):
+            with self._lock:
+                if not self._buffer:
+                    return
+            time.sleep(delay)
+            delay *= 2
+            self.flush()
+        with self._lock:
+            left, self._buffer = self._buffer, []
+            self._oldest = None
+        if left:
+            self._drop(left)
+            logging.error("DB writer closed with %d intelligence records unwritten; dropped them", len(left))
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    """Return the shared buffered writer used by all engines."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = IntelligenceWriter()
+        return _writer
+
+
+def shutdown():
+    """Flush the shared writer and close pooled connections."""
+    global _writer
+    with _writer_lock:
+        writer, _writer = _writer, None
+    try:
+        if writer is not None:
+            writer.close()
     finally:
-        if conn:
-            conn.close()
+        close_pool()
+
+
+atexit.register(shutdown)
+
+
+# Columns read by default through iter_intelligence, in table order;
+# "payload" (a dict) can be requested as well.
+READ_COLUMNS = ("id",) + INTELLIGENCE_COLUMNS
+_READABLE_COLUMNS = READ_COLUMNS + ("payload",)
+_FILTER_COLUMNS = ("source_type", "url", "year")
+
+
+@lru_cache(maxsize=None)
+def row_type(columns):
+    """Namedtuple class for rows with these columns (one class per projection)."""
+    return namedtuple("IntelligenceRow", columns)
+
+
+def _like_pattern(value):
+    escaped = str(value).lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return "%" + escaped + "%"
+
+
+def _read_query(columns, filters, after_id, limit, match=None, equals=None, contains=None):
+    if columns is None:
+        columns = READ_COLUMNS
+    else:
+        unknown = [c for c in columns if c not in _READABLE_COLUMNS]
+        if unknown:
+            raise ValueError("Unknown intelligence columns: %s" % ", ".join(unknown))
+        # keyset pagination continues from the last id, so it is always read
+        columns = ("id",) + tuple(c for c in columns if c != "id")
+    where = ["id > %s"]
+    params = [after_id]
+    for col in _FILTER_COLUMNS:
+        value = filters.get(col)
+        if value is None:
+            continue
+        if isinstance(value, (list, tuple, set, frozenset)):
+            where.append("%s = ANY(%%s)" % col)
+            params.append([str(v) for v in value])
+        else:
+            where.append("%s = %%s" % col)
+            params.append(str(value))
+    if match:
+        # containment is answered by the GIN index on payload
+        where.append("payload @> %s::jsonb")
+        params.append(Json(match))
+    for field, value in (equals or {}).items():
+        # answered by the expression indexes on PAYLOAD_KEY_FIELDS
+        where.append("%s = lower(%%s)" % _payload_field(field))
+        params.append(str(value))
+    for field, value in (contains or {}).items():
+        where.append("%s LIKE %%s" % _payload_field(field))
+        params.append(_like_pattern(value))
+    sql = "SELECT %s FROM intelligence WHERE %s ORDER BY id" % (", ".join(columns), " AND ".join(where))
+    if limit is not None:
+        sql += " LIMIT %s"
+        params.append(limit)
+    return sql, params, tuple(columns)
+
+
+def iter_intelligence(
+    columns=None,
+    source_type=None,
+    url=None,
+    year=None,
+    after_id: int = 0,
+    limit: int = None,
+    batch_size: int = DB_FETCH_SIZE,
+    match: dict = None,
+    equals: dict = None,
+    contains: dict = None,
+):
+    """Iterate over intelligence rows without loading the table.
+
+    Rows come from a server-side cursor `batch_size` at a time, in `id`
+    order, as namedtuples with the requested `columns` (default: the fixed
+    columns; `id` is always included, "payload" may be added). `source_type`,
+    `url` and `year` filter on equality and also accept a list of values.
+    Keyset pagination: pass the last row's `id` as `after_id` to continue
+    after it, and `limit` to cap the rows returned. The pooled connection
+    is held until the iterator is exhausted or closed.
+
+    `match`, `equals` and `contains` filter on the stored engine record
+    (payload): `match={"country": "India"}` keeps rows whose record has
+    exactly those values, `equals={"country": "india"}` compares fields
+    case-insensitively (indexed for vendor_name and country), and
+    `contains={"certifications": "gmp"}` does a case-insensitive substring
+    match per field. For example, GMP-certified vendors in India:
+    `iter_intelligence(source_type="vendor", equals={"country": "india"},
+    contains={"certifications": "gmp"})`.
+    """
+    sql, params, columns = _read_query(
+        columns, {"source_type": source_type, "url": url, "year": year}, after_id, limit, match, equals, contains
+    )
+    Row = row_type(columns)
+    with pooled_connection() as conn:
+        with conn.cursor(name="intelligence_read") as cur:
+            cur.itersize = max(1, batch_size)
+            cur.execute(sql, params)
+            for row in cur:
+                yield Row._make(row)
+
+
+def fetch_page(
+    after_id: int = 0,
+    limit: int = 100,
+    columns=None,
+    source_type=None,
+    url=None,
+    year=None,
+    match: dict = None,
+    equals: dict = None,
+    contains: dict = None,
+):
+    """One keyset page: (rows, next_after_id), next_after_id None after the last page.
+
+    For callers that page on demand (dashboards); each page is a short,
+    independent query, so no cursor stays open between pages. Filters are
+    as for `iter_intelligence`.
+    """
+    sql, params, columns = _read_query(
+        columns, {"source_type": source_type, "url": url, "year": year}, after_id, limit, match, equals, contains
+    )
+    Row = row_type(columns)
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(sql, params)
+            rows = [Row._make(r) for r in cur.fetchall()]
+    next_after_id = rows[-1].id if len(rows) == limit else None
+    return rows, next_after_id
 
 
 def fetch_all():
-    conn = None
+    """Every row as a tuple in table column order.
+
+    Loads the whole table; prefer `iter_intelligence` for anything large.
+    """
     try:
-        conn = get_connection()
-        with conn.cursor() as cur:
-            cur.execute("SELECT * FROM intelligence;")
-            rows = cur.fetchall()
-        return rows
+        return list(iter_intelligence())
     except Exception:
         logging.exception("Failed to fetch intelligence records")
         raise
-    finally:
-        if conn:
-            conn.close()
@@ -1,57 +1,745 @@
 import os
+import re
 import json
+import mmap
+import uuid
 import logging
-from typing import List, Dict
+from dataclasses import dataclass
+from itertools import groupby
+from typing import Iterable, Iterator, List, Dict, Optional
 
 import numpy as np
 from sentence_transformers import SentenceTransformer
 
+from config import EMBED_BATCH_SIZE
+from embedding_cache import get_embedding_cache, text_hash
+from ann_index import Int8Matrix, append_rows, make_backend, quantize_int8, score_rows, top_k_indices
+from bm25 import SAVED_SUFFIXES as BM25_SUFFIXES, BM25Index, reciprocal_rank_fusion
+import metrics
+
+
+_WORD_RE = re.compile(r"\S+")
+_SENTENCE_END_RE = re.compile(r"[.!?][\"')\]]*$")
+
+
+@dataclass
+class Chunk:
+    """A chunk of a document and where it came from.
+
+    `char_start`/`char_end` index the document text with pages joined by
+    "\n" (as `pdf_pipeline.extract_text_from_pdf` returns it); `page` is the
+    page the chunk starts on, or None for plain text.
+    """
+
+    text: str
+    doc_id: Optional[str]
+    page: Optional[int]
+    char_start: int
+    char_end: int
+
+
+def _iter_words(source):
+    """Yield (word, page, start, end) for a str, a text stream or (page, text) pairs."""
+    if isinstance(source, str):
+        source = (source,)
+    pos = 0
+    first = True
+    carry = None  # a word that may continue in the next piece of a stream
+    for item in source:
+        if isinstance(item, tuple):
+            page, text = item
+            joinable = False
+            if not first:
+                pos += 1
+        else:
+            page, text = None, item
+            joinable = True
+        first = False
+        if carry is not None and (not joinable or (text and text[0].isspace())):
+            yield carry
+            carry = None
+        for m in _WORD_RE.finditer(text):
+            word, start, end = m.group(), pos + m.start(), pos + m.end()
+            if carry is not None:
+                if m.start() == 0:
+                    word, start = carry[0] + word, carry[2]
+                else:
+                    yield carry
+                carry = None
+            if joinable and m.end() == len(text):
+                carry = (word, page, start, end)
+            else:
+                yield word, page, start, end
+        pos += len(text)
+    if carry is not None:
+        yield carry
+
+
+def _sentence_cut(window, chunk_size):
+    # last sentence end in the second half of the window, else the full window
+    for j in range(chunk_size - 1, chunk_size // 2 - 1, -1):
+        if _SENTENCE_END_RE.search(window[j][0]):
+            return j + 1
+    return chunk_size
+
+
+def _make_chunk(words, doc_id):
+    return Chunk(" ".join(w[0] for w in words), doc_id, words[0][1], words[0][2], words[-1][3])
+
+
+def iter_chunks(
+    source, doc_id: Optional[str] = None, chunk_size: int = 1000, overlap: int = 200, sentences: bool = False
+) -> Iterator[Chunk]:
+    """Stream `Chunk`s of `chunk_size` whitespace tokens overlapping by `overlap`.
+
+    `source` is a string, a text stream (a file object or any iterable of
+    string pieces, which may split words) or an iterable of (page, text)
+    pairs. Only the current window of words is held in memory. With
+    `sentences=True` a chunk ends after the last sentence in its second
+    half where there is one. Without it the chunk texts are exactly those
+    of `chunk_text`.
+    """
+    step = chunk_size - overlap
+    if step <= 0:
+        raise ValueError("overlap must be smaller than chunk_size")
+    window = []
+    for w in _iter_words(source):
+        window.append(w)
+        if len(window) == chunk_size:
+            cut = _sentence_cut(window, chunk_size) if sentences else chunk_size
+            yield _make_chunk(window[:cut], doc_id)
+            del window[: max(1, cut - overlap)]
+    while window:
+        yield _make_chunk(window[:chunk_size], doc_id)
+        del window[:step]
+
+
+def iter_corpus_chunks(pages: Iterable, **kwargs) -> Iterator[Chunk]:
+    """Chunk (path, page, text) triples from `pdf_pipeline.iter_corpus_pages`, one file at a time.
+
+    Each file's path is its chunks' doc_id; keyword arguments go to `iter_chunks`.
+    """
+    for path, doc_pages in groupby(pages, key=lambda p: p[0]):
+        yield from iter_chunks(((page, text) for _, page, text in doc_pages), doc_id=path, **kwargs)
+
 
 def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 200) -> List[str]:
-    tokens = text.split()
-    chunks = []
-    i = 0
-    while i < len(tokens):
-        chunk = tokens[i : i + chunk_size]
-        chunks.append(" ".join(chunk))
-        i += chunk_size - overlap
-    return chunks
+    return [c.text for c in iter_chunks(text, chunk_size=chunk_size, overlap=overlap)]
+
+
+# Every file an index snapshot (`InMemoryIndex.save`) and its append log
+# may consist of.
+SNAPSHOT_SUFFIXES = (
+    (".npy", ".q8.npy", ".q8scale.npy", ".text.bin", ".text.idx.npy")
+    + (".chunk_ids.npy", ".doc_rows.npy", ".spans.npy", ".ivf.npz")
+    + BM25_SUFFIXES
+    + (".json", ".log.jsonl", ".log.f32")
+)
+
+
+# Files `save` writes before the .json; their sizes and mtimes are recorded
+# in it, so a reader can tell whether they all belong to that snapshot.
+_DATA_SUFFIXES = tuple(ext for ext in SNAPSHOT_SUFFIXES if ext not in (".json", ".log.jsonl", ".log.f32"))
+
+
+def _file_stamp(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+
+def snapshot_generation(path: str) -> Optional[str]:
+    """Generation of the complete snapshot at `path`, else None.
+
+    None while there is no snapshot or one is being written: some file no
+    longer matches the size and mtime its .json recorded. Snapshots written
+    before generations existed count as complete.
+    """
+    try:
+        with open(path + ".json", "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(data, dict) or "generation" not in data:
+        return "legacy-%s" % _file_stamp(path + ".json")
+    for ext in _DATA_SUFFIXES:
+        if _file_stamp(path + ext) != data["files"].get(ext):
+            return None
+    return data["generation"]
+
+
+def _remove_if_exists(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _save_npy(path, arr):
+    # Write-then-rename: readers may have the old file memory-mapped.
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        np.save(f, arr)
+    os.replace(tmp, path)
+
+
+def _span_rows(spans, n):
+    """(page, char_start, char_end) rows for `n` chunks; -1 marks no page / no span."""
+    if spans is None:
+        return np.full((n, 3), -1, dtype=np.int64)
+    rows = np.array([[-1 if page is None else page, start, end] for page, start, end in spans], dtype=np.int64)
+    if rows.shape != (n, 3):
+        raise ValueError("expected one (page, start, end) span per chunk")
+    return rows
+
+
+def write_text_store(path: str, chunks):
+    """Write chunks as UTF-8 to `path.text.bin` with offsets in `path.text.idx.npy`."""
+    offsets = [0]
+    with open(path + ".text.bin.tmp", "wb") as f:
+        for c in chunks:
+            b = c.encode("utf-8")
+            f.write(b)
+            offsets.append(offsets[-1] + len(b))
+    os.replace(path + ".text.bin.tmp", path + ".text.bin")
+    _save_npy(path + ".text.idx.npy", np.asarray(offsets, dtype=np.int64))
+
+
+class ChunkStore:
+    """Read-only chunk texts backed by a memory-mapped file.
+
+    Only the chunks actually indexed into are read, so loading costs nothing
+    per chunk. Chunks added after loading are kept in memory.
+    """
+
+    def __init__(self, path: str):
+        self._offsets = np.load(path + ".text.idx.npy", mmap_mode="r")
+        self._file = open(path + ".text.bin", "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self._base = len(self._offsets) - 1
+        self._tail = []
+
+    def __len__(self):
+        return self._base + len(self._tail)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if i < self._base:
+            return self._data[int(self._offsets[i]) : int(self._offsets[i + 1])].decode("utf-8")
+        return self._tail[i - self._base]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def extend(self, texts):
+        self._tail.extend(texts)
 
 
 class InMemoryIndex:
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
-        self.model = SentenceTransformer(model_name)
+    """Dense chunk index with stable chunk ids and per-document add/remove.
+
+    `build` indexes a flat list of chunks; `add(texts, doc_id)` and
+    `remove(doc_id)` update the index one document at a time, encoding only
+    the new chunks. `save` writes a full snapshot; `append` writes just the
+    changes since the last save/load/append to a log next to it, which
+    `load` replays.
+
+    `backend` chooses the search strategy: "exact" (default) or "ivf" for
+    approximate search on large corpora (see ann_index.py), or a backend
+    instance with custom settings. Its state is saved with the index.
+
+    Saved indexes are loaded memory-mapped: embeddings and chunk text stay
+    on disk (shared between processes through the page cache) and only the
+    rows a query touches are read. `save(path, quantization="float16")`
+    halves the embedding file; "int8" adds an int8 copy that is searched
+    first, with the best `rescore_factor * top_k` candidates rescored
+    against the float16 rows.
+
+    Unless `sparse=False`, a BM25 keyword index (bm25.py) is kept over the
+    same chunks and saved with them; `query(..., hybrid=True)` fuses its
+    ranking with the dense one by reciprocal rank fusion, which helps on
+    exact terms (compound names, DOIs, units) that embeddings blur.
+    """
+
+    rescore_factor = 4
+    # candidates taken from each ranking before fusion, and the RRF constant
+    fusion_depth = 50
+    rrf_k = 60
+
+    def __init__(
+        self, model_name: str = "all-MiniLM-L6-v2", backend=None, embedding_cache=None, sparse: bool = True, model=None
+    ):
+        self.model_name = model_name
+        # pass an already-loaded SentenceTransformer to share it between indexes
+        self.model = model if model is not None else SentenceTransformer(model_name)
+        self.backend = make_backend(backend)
+        self.bm25 = BM25Index() if sparse else None
+        # Chunk embeddings already computed for this model are reused;
+        # pass embedding_cache=False to always encode.
+        if embedding_cache is None:
+            embedding_cache = get_embedding_cache()
+        self.embedding_cache = embedding_cache or None
         self.embeddings = None
         self.chunks = []
+        # Per-row arrays (memory-mapped after load). Ids only grow and rows
+        # are only appended or dropped, so chunk_ids stays sorted.
+        self.chunk_ids = np.zeros(0, dtype=np.int64)
+        # index into _doc_names, -1 for chunks added by build()
+        self._doc_rows = np.zeros(0, dtype=np.int32)
+        self._spans = _span_rows(None, 0)
+        self._doc_names: List[str] = []
+        self._doc_index: Dict[str, int] = {}
+        self.docs: Dict[str, dict] = {}
+        self._next_id = 0
+        # int8 copy of the embeddings, present only while it matches them
+        self._q8 = None
+        # spare capacity behind the per-row arrays (see ann_index.append_rows)
+        self._row_bufs = {}
+        # Changes not yet written by append(); None means only a full save will do.
+        self._pending = []
 
-    def build(self, texts: List[str]):
-        self.chunks = texts
-        embs = self.model.encode(texts, show_progress_bar=True, convert_to_numpy=True)
+    def _empty(self):
+        return np.zeros((0, self.model.get_sentence_embedding_dimension()), dtype=np.float32)
+
+    def _encode_raw(self, texts: List[str], show_progress_bar: bool = False):
+        metrics.inc("embed_chunks", len(texts))
+        with metrics.timer("embed"):
+            embs = self.model.encode(
+                texts, batch_size=EMBED_BATCH_SIZE, show_progress_bar=show_progress_bar, convert_to_numpy=True
+            )
+        embs = np.asarray(embs, dtype=np.float32)
         # normalize for cosine
         norms = np.linalg.norm(embs, axis=1, keepdims=True)
         norms[norms == 0] = 1
-        self.embeddings = embs / norms
+        return embs / norms
+
+    def _encode(self, texts: List[str], show_progress_bar: bool = False):
+        """Normalised embeddings for chunks, encoding only cache misses."""
+        if self.embedding_cache is None or not texts:
+            return self._encode_raw(texts, show_progress_bar)
+        hashes = [text_hash(t) for t in texts]
+        cached = self.embedding_cache.get_many(self.model_name, hashes)
+        # each distinct missing text is encoded once, in one batched call
+        missing = {}
+        for h, t in zip(hashes, texts):
+            if h not in cached and h not in missing:
+                missing[h] = t
+        if missing:
+            embs = self._encode_raw(list(missing.values()), show_progress_bar)
+            self.embedding_cache.put_many(self.model_name, list(missing), embs)
+            cached.update(zip(missing, embs))
+        logging.info(
+            "Embedded %d chunks: %d from cache, %d encoded (cache hit rate %.0f%%)",
+            len(texts),
+            len(texts) - sum(1 for h in hashes if h in missing),
+            len(missing),
+            100.0 * self.embedding_cache.stats()["hit_rate"],
+        )
+        return np.stack([cached[h] for h in hashes]).astype(np.float32, copy=False)
+
+    def build(self, texts: List[str]):
+        self.chunks = list(texts)
+        self.embeddings = self._encode(self.chunks, show_progress_bar=True)
+        self._q8 = None
+        self._row_bufs = {}
+        self.backend.fit(self.embeddings)
+        self.chunk_ids = np.arange(len(self.chunks), dtype=np.int64)
+        self._doc_rows = np.full(len(self.chunks), -1, dtype=np.int32)
+        self._spans = _span_rows(None, len(self.chunks))
+        self._doc_names, self._doc_index = [], {}
+        self.docs = {}
+        self._next_id = len(self.chunks)
+        if self.bm25 is not None:
+            self.bm25 = BM25Index(self.bm25.k1, self.bm25.b)
+            self.bm25.add(self.chunk_ids, self.chunks)
+        self._pending = None
+
+    def add(self, texts: List[str], doc_id: str, metadata: Optional[dict] = None, spans=None) -> List[int]:
+        """Add one document's chunks, replacing any chunks already stored for it.
+
+        `spans` optionally gives each chunk's (page, char_start, char_end),
+        as `add_chunks` does (see `span`). Returns the new chunks' ids.
+        """
+        doc_id = str(doc_id)
+        if doc_id in self.docs:
+            self.remove(doc_id)
+        texts = list(texts)
+        ids = list(range(self._next_id, self._next_id + len(texts)))
+        self._next_id += len(texts)
+        meta = dict(metadata or {})
+        meta["n_chunks"] = len(texts)
+        embs = self._encode(texts) if texts else None
+        self._append_doc(doc_id, meta, ids, texts, embs, spans)
+        if self._pending is not None:
+            self._pending.append(("add", doc_id, meta, ids, texts, embs, spans))
+        return ids
 
-    def save(self, path: str):
+    def _append_doc(self, doc_id, meta, ids, texts, embs, spans):
+        """Record `doc_id` and append its chunks as new rows."""
+        self.docs[doc_id] = meta
+        if doc_id not in self._doc_index:
+            self._doc_index[doc_id] = len(self._doc_names)
+            self._doc_names.append(doc_id)
+        if not ids:
+            return
+        self._append_rows(embs)
+        self.chunks.extend(texts)
+        self._grow("chunk_ids", np.asarray(ids, dtype=np.int64))
+        self._grow("_doc_rows", np.full(len(ids), self._doc_index[doc_id], dtype=np.int32))
+        self._grow("_spans", _span_rows(spans, len(ids)))
+        if self.bm25 is not None:
+            self.bm25.add(ids, texts)
+
+    def remove(self, doc_id: str) -> int:
+        """Drop every chunk of `doc_id`; returns how many were removed."""
+        doc_id = str(doc_id)
+        if doc_id not in self.docs:
+            return 0
+        del self.docs[doc_id]
+        if doc_id in self._doc_index:
+            mine = self._doc_rows == self._doc_index[doc_id]
+        else:
+            mine = np.zeros(len(self._doc_rows), dtype=bool)
+        removed = int(mine.sum())
+        if removed:
+            keep = np.flatnonzero(~mine)
+            if self.bm25 is not None:
+                gone = np.flatnonzero(mine).tolist()
+                self.bm25.remove(self.chunk_ids[gone].tolist(), [self.chunks[i] for i in gone])
+            self._q8 = None
+            self._row_bufs = {}
+            self.embeddings = self.embeddings[keep]
+            self.backend.remove(keep)
+            self.chunks = [self.chunks[i] for i in keep.tolist()]
+            self.chunk_ids = self.chunk_ids[keep]
+            self._doc_rows = self._doc_rows[keep]
+            self._spans = self._spans[keep]
+        if self._pending is not None:
+            self._pending.append(("remove", doc_id))
+        return removed
+
+    def _grow(self, name, rows):
+        """Append `rows` to the per-row array attribute `name` without
+        copying it each time, so adding documents one by one stays linear."""
+        arr, self._row_bufs[name] = append_rows(getattr(self, name), rows, self._row_bufs.get(name))
+        setattr(self, name, arr)
+
+    def _append_rows(self, embs):
+        self._q8 = None
+        if self.embeddings is None:
+            self.embeddings = embs
+            self.backend.fit(embs)
+        else:
+            self._grow("embeddings", embs)
+            self.backend.add(embs)
+
+    def set_backend(self, backend):
+        """Switch search backend (name, params dict or instance) and fit it."""
+        self.backend = make_backend(backend)
+        self.backend.fit(self.embeddings if self.embeddings is not None else self._empty())
+        self._pending = None
+
+    def save(self, path: str, quantization: Optional[str] = None):
+        """Write a full snapshot and drop any append log.
+
+        `quantization` is None (float32), "float16" or "int8" (float16 plus
+        an int8 search copy).
+        """
+        if quantization not in (None, "float16", "int8"):
+            raise ValueError("quantization must be None, 'float16' or 'int8'")
         ensure_dir = os.path.dirname(path)
         if ensure_dir:
             os.makedirs(ensure_dir, exist_ok=True)
-        np.save(path + ".npy", self.embeddings)
-        with open(path + ".json", "w", encoding="utf-8") as f:
-            json.dump(self.chunks, f)
+        embs = self.embeddings if self.embeddings is not None else self._empty()
+        _save_npy(path + ".npy", embs.astype(np.float16 if quantization else np.float32, copy=False))
+        if quantization == "int8":
+            codes, scales = quantize_int8(embs)
+            _save_npy(path + ".q8.npy", codes)
+            _save_npy(path + ".q8scale.npy", scales)
+        else:
+            _remove_if_exists(path + ".q8.npy")
+            _remove_if_exists(path + ".q8scale.npy")
+        write_text_store(path, self.chunks)
+        # Only documents still indexed are written, renumbered in `docs` order.
+        names = list(self.docs)
+        index = {d: i for i, d in enumerate(names)}
+        # the trailing -1 maps rows without a document (index -1) to -1
+        remap = np.array([index.get(d, -1) for d in self._doc_names] + [-1], dtype=np.int32)
+        self._doc_rows = remap[self._doc_rows]
+        self._doc_names, self._doc_index = names, index
+        _save_npy(path + ".chunk_ids.npy", np.asarray(self.chunk_ids, dtype=np.int64))
+        _save_npy(path + ".doc_rows.npy", self._doc_rows)
+        _save_npy(path + ".spans.npy", np.asarray(self._spans, dtype=np.int64))
+        self.backend.save(path)
+        if self.bm25 is not None:
+            self.bm25.save(path)
+        else:
+            for ext in BM25_SUFFIXES + (".bm25.npz",):
+                _remove_if_exists(path + ext)
+        # The JSON goes last and stamps the files written above with a new
+        # generation (see `snapshot_generation`).
+        with open(path + ".json.tmp", "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "version": 4,
+                    "generation": uuid.uuid4().hex,
+                    "n_rows": len(self.chunks),
+                    "files": {ext: _file_stamp(path + ext) for ext in _DATA_SUFFIXES},
+                    "model_name": self.model_name,
+                    "quantization": quantization,
+                    "doc_names": names,
+                    "docs": self.docs,
+                    "next_id": self._next_id,
+                    "backend": self.backend.params(),
+                    "sparse": self.bm25 is not None,
+                },
+                f,
+            )
+        os.replace(path + ".json.tmp", path + ".json")
+        _remove_if_exists(path + ".log.jsonl")
+        _remove_if_exists(path + ".log.f32")
+        self._pending = []
 
-    def load(self, path: str):
-        self.embeddings = np.load(path + ".npy")
+    def append(self, path: str):
+        """Append changes since the last save/load/append to the log at `path`.
+
+        Falls back to a full `save` when there is no snapshot yet or the
+        index was rebuilt. Call `save` now and then to compact the log.
+        """
+        if self._pending is None or not os.path.exists(path + ".json"):
+            self.save(path)
+            return
+        if not self._pending:
+            return
+        emb_path = path + ".log.f32"
+        with open(emb_path, "ab") as ef, open(path + ".log.jsonl", "a", encoding="utf-8") as lf:
+            for op in self._pending:
+                if op[0] == "add":
+                    _, doc_id, meta, ids, texts, embs, spans = op
+                    # position in float32s, so replay doesn't depend on earlier entries
+                    offset = ef.tell() // 4
+                    if embs is not None:
+                        ef.write(np.ascontiguousarray(embs, dtype=np.float32).tobytes())
+                        ef.flush()
+                    record = {
+                        "op": "add",
+                        "doc_id": doc_id,
+                        "metadata": meta,
+                        "ids": ids,
+                        "chunks": texts,
+                        "spans": spans,
+                        "offset": offset,
+                    }
+                else:
+                    record = {"op": "remove", "doc_id": op[1]}
+                lf.write(json.dumps(record) + "\n")
+        self._pending = []
+
+    def load(self, path: str, mmap: bool = True):
+        """Load a snapshot (memory-mapped unless `mmap=False`) and replay its log."""
+        mode = "r" if mmap else None
+        self.embeddings = np.load(path + ".npy", mmap_mode=mode)
         with open(path + ".json", "r", encoding="utf-8") as f:
-            self.chunks = json.load(f)
+            data = json.load(f)
+        if isinstance(data, list):
+            # original format: just the chunk strings
+            data = {"chunks": data}
+        if "chunks" in data:
+            # versions 1-2 kept the chunk text in the JSON
+            self.chunks = data["chunks"]
+        elif mmap:
+            self.chunks = ChunkStore(path)
+        else:
+            self.chunks = list(ChunkStore(path))
+        self._q8 = None
+        self._row_bufs = {}
+        if data.get("quantization") == "int8":
+            self._q8 = Int8Matrix(
+                np.load(path + ".q8.npy", mmap_mode=mode), np.load(path + ".q8scale.npy", mmap_mode=mode)
+            )
+        self.docs = data.get("docs", {})
+        if "doc_names" in data:
+            self._doc_names = data["doc_names"]
+            self.chunk_ids = np.load(path + ".chunk_ids.npy", mmap_mode=mode)
+            self._doc_rows = np.load(path + ".doc_rows.npy", mmap_mode=mode)
+            self._spans = np.load(path + ".spans.npy", mmap_mode=mode)
+        else:
+            self._load_row_lists(data, len(self.chunks))
+        self._doc_index = {d: i for i, d in enumerate(self._doc_names)}
+        self._next_id = data.get("next_id", len(self.chunks))
+        self._check_rows(path, data.get("n_rows", len(self.chunks)))
+        self.backend = make_backend(data.get("backend"))
+        if not self.backend.load(path, len(self.chunks)):
+            self.backend.fit(self.embeddings)
+        if self.bm25 is not None and not self.bm25.load(path, len(self.chunks), mmap=mmap):
+            # snapshot from before keyword search, or written with sparse=False
+            self.bm25 = BM25Index(self.bm25.k1, self.bm25.b)
+            self.bm25.add(self.chunk_ids, self.chunks)
+        self._replay_log(path)
+        self._pending = []
+
+    def _check_rows(self, path, n):
+        """Raise if the loaded files disagree on the row count (e.g. a save
+        was in progress), rather than fail on the first query."""
+        sizes = {
+            "embeddings": len(self.embeddings),
+            "chunks": len(self.chunks),
+            "chunk_ids": len(self.chunk_ids),
+            "doc_rows": len(self._doc_rows),
+            "spans": len(self._spans),
+        }
+        if self._q8 is not None:
+            sizes["int8 codes"] = len(self._q8)
+        bad = {k: v for k, v in sizes.items() if v != n}
+        if bad:
+            raise ValueError("Index snapshot %s is inconsistent: %d rows, but %s" % (path, n, bad))
+
+    def _load_row_lists(self, data, n):
+        """Per-row arrays from a version 1-3 snapshot, which kept them as JSON lists."""
+        self.chunk_ids = np.asarray(data.get("chunk_ids", range(n)), dtype=np.int64)
+        doc_ids = data.get("doc_ids", [None] * n)
+        self._doc_names = list(self.docs)
+        self._doc_names += [d for d in dict.fromkeys(doc_ids) if d is not None and d not in self.docs]
+        index = {d: i for i, d in enumerate(self._doc_names)}
+        self._doc_rows = np.array([-1 if d is None else index[d] for d in doc_ids], dtype=np.int32)
+        self._spans = _span_rows(None, n)
+        # add_chunks kept offsets in the document metadata; its rows are consecutive
+        first = {}
+        for row, d in enumerate(doc_ids):
+            first.setdefault(d, row)
+        for d, meta in self.docs.items():
+            spans = meta.pop("spans", None)
+            if spans and d in first:
+                self._spans[first[d] : first[d] + len(spans)] = _span_rows(spans, len(spans))
+
+    def _replay_log(self, path: str):
+        log_path = path + ".log.jsonl"
+        if not os.path.exists(log_path):
+            return
+        dim = self.embeddings.shape[1]
+        flat = np.fromfile(path + ".log.f32", dtype=np.float32) if os.path.exists(path + ".log.f32") else np.zeros(0, np.float32)
+        n = 0
+        with open(log_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    op = json.loads(line)
+                except ValueError:
+                    logging.warning("Ignoring truncated index log entry in %s", log_path)
+                    break
+                if op["op"] == "remove":
+                    self._drop_doc(op["doc_id"])
+                else:
+                    self._drop_doc(op["doc_id"])
+                    ids, texts, meta = op["ids"], op["chunks"], op["metadata"]
+                    # older logs kept add_chunks offsets in the metadata
+                    spans = op.get("spans") or meta.pop("spans", None)
+                    start = op["offset"]
+                    embs = flat[start : start + len(ids) * dim].reshape(len(ids), dim)
+                    self._append_doc(op["doc_id"], meta, ids, texts, embs, spans)
+                    if ids:
+                        self._next_id = max(self._next_id, ids[-1] + 1)
+                n += 1
+        logging.info("Replayed %d index log entries from %s", n, log_path)
+
+    def _drop_doc(self, doc_id):
+        pending, self._pending = self._pending, None
+        try:
+            self.remove(doc_id)
+        finally:
+            self._pending = pending
+
+    def _search_batch(self, queries, top_k):
+        if self._q8 is None:
+            return self.backend.search_batch(self.embeddings, queries, top_k)
+        # Coarse pass on int8, then exact scores for each query's shortlist.
+        out = []
+        for q, (rows, _) in zip(queries, self.backend.search_batch(self._q8, queries, top_k * self.rescore_factor)):
+            rows = np.sort(rows)
+            scores = score_rows(self.embeddings[rows], q)
+            best = top_k_indices(scores, top_k)
+            out.append((rows[best], scores[best]))
+        return out
+
+    def _encode_queries(self, questions: List[str]):
+        q_emb = self.model.encode(list(questions), batch_size=EMBED_BATCH_SIZE, convert_to_numpy=True)
+        q_emb = np.asarray(q_emb, dtype=np.float32)
+        return q_emb / (np.linalg.norm(q_emb, axis=1, keepdims=True) + 1e-12)
+
+    def add_chunks(self, chunks: Iterable[Chunk]) -> int:
+        """Add a stream of `Chunk`s (e.g. from `iter_corpus_chunks`) document by document.
+
+        Chunks of one document must be consecutive. Only one document's chunks
+        are held at a time, and their offsets are kept per chunk (see
+        `span`). If the stream more than doubles the index (e.g. builds it
+        from empty), the search backend is refit on all rows afterwards
+        rather than left trained on the first document. Returns the number
+        of chunks added.
+        """
+        before = len(self.chunk_ids)
+        n = 0
+        for doc_id, doc_chunks in groupby(chunks, key=lambda c: c.doc_id):
+            doc_chunks = list(doc_chunks)
+            spans = [[c.page, c.char_start, c.char_end] for c in doc_chunks]
+            self.add([c.text for c in doc_chunks], doc_id, spans=spans)
+            n += len(doc_chunks)
+        if n > before:
+            self.set_backend(self.backend)
+        return n
+
+    def span(self, chunk_id):
+        """(doc_id, page, char_start, char_end) of a chunk added by `add_chunks`, else None."""
+        row = self._row_of(chunk_id)
+        page, start, end = (int(v) for v in self._spans[row])
+        if start < 0:
+            return None
+        return self._doc_names[self._doc_rows[row]], None if page < 0 else page, start, end
+
+    def _row_of(self, chunk_id):
+        row = int(np.searchsorted(self.chunk_ids, chunk_id))
+        if row >= len(self.chunk_ids) or self.chunk_ids[row] != chunk_id:
+            raise KeyError(chunk_id)
+        return row
+
+    def _fuse(self, question, rows, top_k):
+        dense = self.chunk_ids[np.asarray(rows, dtype=np.intp)].tolist()
+        sparse = [cid for cid, _ in self.bm25.search(question, self.fusion_depth)]
+        out = []
+        for cid, score in reciprocal_rank_fusion([dense, sparse], self.rrf_k)[:top_k]:
+            out.append((cid, score, self.chunks[self._row_of(cid)]))
+        return out
+
+    def query_batch(self, questions: List[str], top_k: int = 5, hybrid: bool = False):
+        """Like `query` for many questions: one encode call and batched scoring.
+
+        Returns one (chunk_id, score, text) list per question, in order.
+        """
+        if not questions:
+            return []
+        if hybrid and self.bm25 is None:
+            hybrid = False
+        metrics.inc("retrieval_queries", len(questions))
+        with metrics.timer("retrieval"):
+            depth = max(top_k, self.fusion_depth) if hybrid else top_k
+            results = self._search_batch(self._encode_queries(questions), depth)
+            if hybrid:
+                return [self._fuse(q, rows, top_k) for q, (rows, _) in zip(questions, results)]
+            return [
+                [(int(self.chunk_ids[int(i)]), float(s), self.chunks[int(i)]) for i, s in zip(rows, scores)]
+                for rows, scores in results
+            ]
 
-    def query(self, q: str, top_k: int = 5):
-        q_emb = self.model.encode([q], convert_to_numpy=True)
-        q_emb = q_emb / (np.linalg.norm(q_emb, axis=1, keepdims=True) + 1e-12)
-        sims = (self.embeddings @ q_emb.T).squeeze()
-        idx = np.argsort(-sims)[:top_k]
-        return [(int(i), float(sims[i]), self.chunks[int(i)]) for i in idx]
+    def query(self, q: str, top_k: int = 5, hybrid: bool = False):
+        """Return (chunk_id, score, text) for the top_k most similar chunks.
 
+        With `hybrid=True` the dense and BM25 rankings are fused and the
+        score is the RRF score rather than a cosine similarity.
+        """
+        return self.query_batch([q], top_k=top_k, hybrid=hybrid)[0]
 
 if __name__ == "__main__":
     # quick test helper
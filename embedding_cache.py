@@ -0,0 +1,89 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from typing import Dict, List
+
+import numpy as np
+from config import EMBED_CACHE_PATH
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """SQLite store of chunk embeddings keyed by (model name, SHA-256 of the text).
+
+    Rebuilding an index, re-adding a re-downloaded PDF or re-chunking with
+    overlap mostly produces text that was embedded before; those vectors are
+    read back instead of recomputed.
+    """
+
+    def __init__(self, path: str = EMBED_CACHE_PATH):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    model TEXT NOT NULL,
+                    text_hash TEXT NOT NULL,
+                    dim INTEGER NOT NULL,
+                    vec BLOB NOT NULL,
+                    PRIMARY KEY (model, text_hash)
+                )"""
+            )
+
+    def get_many(self, model: str, hashes: List[str]) -> Dict[str, np.ndarray]:
+        """Return {text_hash: vector} for the hashes that are cached."""
+        found = {}
+        unique = list(dict.fromkeys(hashes))
+        with self._lock:
+            for s in range(0, len(unique), 500):
+                part = unique[s : s + 500]
+                rows = self._db.execute(
+                    "SELECT text_hash, dim, vec FROM embeddings WHERE model = ? AND text_hash IN (%s)"
+                    % ",".join("?" * len(part)),
+                    [model] + part,
+                ).fetchall()
+                for h, dim, vec in rows:
+                    found[h] = np.frombuffer(vec, dtype=np.float32, count=dim)
+            self.hits += sum(1 for h in hashes if h in found)
+            self.misses += sum(1 for h in hashes if h not in found)
+        return found
+
+    def put_many(self, model: str, hashes: List[str], vectors: np.ndarray):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, dim, vec) VALUES (?, ?, ?, ?)",
+                [(model, h, v.shape[0], v.tobytes()) for h, v in zip(hashes, vectors)],
+            )
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache():
+    """Return the embedding cache shared by every index in the process."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = EmbeddingCache()
+        return _cache
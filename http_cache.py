@@ -0,0 +1,281 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import requests
+from config import HTTP_CACHE_DIR, HTTP_CACHE_TTL, HTTP_CACHE_MAX_BYTES
+
+
+@dataclass
+class CacheEntry:
+    url: str
+    sha256: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    content_type: Optional[str]
+    size: int
+    fetched_at: float
+
+
+class CachedResponse:
+    """The parts of a `requests.Response` that callers of the cache use."""
+
+    def __init__(self, url, status_code, headers, content, from_cache=False, truncated=False):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.from_cache = from_cache
+        self.truncated = truncated
+
+    @property
+    def text(self):
+        encoding = requests.utils.get_encoding_from_headers(self.headers) or "utf-8"
+        try:
+            return self.content.decode(encoding, errors="replace")
+        except LookupError:
+            return self.content.decode("utf-8", errors="replace")
+
+
+class HttpCache:
+    """Content-addressed on-disk HTTP cache.
+
+    Bodies are stored once per SHA-256 under `root/blobs`, and a SQLite index
+    maps each URL to its body and validators. Entries younger than `ttl`
+    seconds are served without touching the network; older ones are
+    revalidated with If-None-Match / If-Modified-Since, so an unchanged
+    resource costs a 304. When the bodies exceed `max_bytes` the least
+    recently used ones are evicted.
+    """
+
+    def __init__(self, root: str = HTTP_CACHE_DIR, ttl: float = HTTP_CACHE_TTL, max_bytes: int = HTTP_CACHE_MAX_BYTES):
+        self.root = root
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.join(root, "blobs"), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(root, "index.sqlite"), check_same_thread=False)
+        with self._db:
+            self._db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS blobs (
+                    sha256 TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    accessed_at REAL NOT NULL
+                )"""
+            )
+            self._db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS entries (
+                    url TEXT PRIMARY KEY,
+                    sha256 TEXT NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    content_type TEXT,
+                    fetched_at REAL NOT NULL
+                )"""
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS entries_sha256 ON entries (sha256)")
+
+    def blob_path(self, sha256):
+        return os.path.join(self.root, "blobs", sha256[:2], sha256)
+
+    def lookup(self, url) -> Optional[CacheEntry]:
+        with self._lock:
+            row = self._db.execute(
+                """
+                SELECT e.url, e.sha256, e.etag, e.last_modified, e.content_type, b.size, e.fetched_at
+                FROM entries e JOIN blobs b ON b.sha256 = e.sha256
+                WHERE e.url = ?""",
+                (url,),
+            ).fetchone()
+        if row is None:
+            return None
+        entry = CacheEntry(*row)
+        if not os.path.exists(self.blob_path(entry.sha256)):
+            self._forget_blob(entry.sha256)
+            return None
+        return entry
+
+    def is_fresh(self, entry: CacheEntry):
+        return time.time() - entry.fetched_at < self.ttl
+
+    def validators(self, entry: CacheEntry):
+        headers = {}
+        if entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def touch(self, entry: CacheEntry):
+        with self._lock, self._db:
+            self._db.execute("UPDATE blobs SET accessed_at = ? WHERE sha256 = ?", (time.time(), entry.sha256))
+
+    def revalidated(self, entry: CacheEntry, headers):
+        """Record a 304 for `entry`, restarting its TTL."""
+        now = time.time()
+        etag = headers.get("ETag") or entry.etag
+        last_modified = headers.get("Last-Modified") or entry.last_modified
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE entries SET fetched_at = ?, etag = ?, last_modified = ? WHERE url = ?",
+                (now, etag, last_modified, entry.url),
+            )
+            self._db.execute("UPDATE blobs SET accessed_at = ? WHERE sha256 = ?", (now, entry.sha256))
+        entry.fetched_at, entry.etag, entry.last_modified = now, etag, last_modified
+        return entry
+
+    def read(self, entry: CacheEntry, limit: int = None):
+        with open(self.blob_path(entry.sha256), "rb") as f:
+            return f.read() if limit is None else f.read(limit)
+
+    def store(self, url, content: bytes, headers) -> Optional[CacheEntry]:
+        if not _cacheable(headers):
+            return None
+        sha = hashlib.sha256(content).hexdigest()
+        path = self.blob_path(sha)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = "%s.%d.%d.tmp" % (path, os.getpid(), threading.get_ident())
+            with open(tmp, "wb") as f:
+                f.write(content)
+            os.replace(tmp, path)
+        return self._index(url, sha, len(content), headers)
+
+    def _index(self, url, sha, size, headers):
+        now = time.time()
+        entry = CacheEntry(
+            url=url,
+            sha256=sha,
+            etag=headers.get("ETag"),
+            last_modified=headers.get("Last-Modified"),
+            content_type=headers.get("Content-Type"),
+            size=size,
+            fetched_at=now,
+        )
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO blobs (sha256, size, accessed_at) VALUES (?, ?, ?)",
+                (sha, size, now),
+            )
+            self._db.execute(
+                """
+                INSERT OR REPLACE INTO entries (url, sha256, etag, last_modified, content_type, fetched_at)
+                VALUES (?, ?, ?, ?, ?, ?)""",
+                (url, sha, entry.etag, entry.last_modified, entry.content_type, now),
+            )
+        self.evict()
+        return entry
+
+    def _forget_blob(self, sha):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM entries WHERE sha256 = ?", (sha,))
+            self._db.execute("DELETE FROM blobs WHERE sha256 = ?", (sha,))
+        try:
+            os.remove(self.blob_path(sha))
+        except FileNotFoundError:
+            pass
+
+    def total_bytes(self):
+        with self._lock:
+            return self._db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+
+    def evict(self):
+        """Drop least recently used bodies until the cache fits in `max_bytes`."""
+        total = self.total_bytes()
+        if total <= self.max_bytes:
+            return 0
+        with self._lock:
+            rows = self._db.execute("SELECT sha256, size FROM blobs ORDER BY accessed_at").fetchall()
+        evicted = 0
+        for sha, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._forget_blob(sha)
+            total -= size
+            evicted += 1
+        logging.debug("HTTP cache evicted %d bodies", evicted)
+        return evicted
+
+    def get(self, url, session=None, headers=None, timeout=10, max_bytes: int = None) -> CachedResponse:
+        """GET `url` through the cache; raises for HTTP errors like `requests`.
+
+        With `max_bytes` the body is streamed and reading stops at that many
+        bytes; the response is then marked `truncated`. A truncated body is
+        returned but not cached, so the cache only ever holds whole bodies.
+        """
+        entry = self.lookup(url)
+        if entry and self.is_fresh(entry):
+            self.touch(entry)
+            return self._cached_response(entry, max_bytes)
+
+        send = dict(headers or {})
+        if entry:
+            send.update(self.validators(entry))
+        if max_bytes is None:
+            r = (session or requests).get(url, headers=send, timeout=timeout)
+        else:
+            r = (session or requests).get(url, headers=send, timeout=timeout, stream=True)
+        try:
+            if r.status_code == 304 and entry:
+                logging.debug("HTTP cache revalidated: %s", url)
+                return self._cached_response(self.revalidated(entry, r.headers), max_bytes)
+            r.raise_for_status()
+            if max_bytes is None:
+                content, truncated = r.content, False
+            else:
+                content, truncated = _read_capped(r, max_bytes)
+        finally:
+            r.close()
+        if truncated:
+            logging.debug("Body of %s cut at %d bytes; not cached", url, max_bytes)
+        else:
+            self.store(url, content, r.headers)
+        return CachedResponse(url, r.status_code, dict(r.headers), content, truncated=truncated)
+
+    def _cached_response(self, entry, max_bytes=None):
+        headers = {}
+        if entry.content_type:
+            headers["Content-Type"] = entry.content_type
+        truncated = max_bytes is not None and entry.size > max_bytes
+        return CachedResponse(
+            entry.url, 200, headers, self.read(entry, max_bytes), from_cache=True, truncated=truncated
+        )
+
+
+def _read_capped(r, max_bytes):
+    """Read a streamed response up to `max_bytes`; returns (body, truncated)."""
+    chunks = []
+    size = 0
+    for chunk in r.iter_content(chunk_size=64 * 1024):
+        if not chunk:
+            continue
+        if size + len(chunk) > max_bytes:
+            chunks.append(chunk[: max_bytes - size])
+            return b"".join(chunks), True
+        chunks.append(chunk)
+        size += len(chunk)
+    return b"".join(chunks), False
+
+
+def _cacheable(headers):
+    return "no-store" not in (headers.get("Cache-Control") or "").lower()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Return the shared cache used by scrape()."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = HttpCache()
+        return _cache
@@ -1,22 +1,92 @@
 import logging
-from typing import List
+from typing import TYPE_CHECKING, Iterator, List
 
-import ollama
-from config import OLLAMA_MODEL
-from embed_index import InMemoryIndex
+import requests
+from config import OLLAMA_MODEL, QA_CONTEXT_TOKENS, QA_SERVER_HOST, QA_SERVER_PORT
+from llm_cache import get_answer_cache
+from llm_client import PRIORITY_BULK, PRIORITY_INTERACTIVE, get_scheduler
+
+if TYPE_CHECKING:
+    # not imported at runtime: the CLI client should start without loading torch
+    from embed_index import InMemoryIndex
+
+# Bump when the QA prompt changes so cached answers are not reused.
+PROMPT_VERSION = "qa-v1"
+
+
+def _overlap(a: List[str], b: List[str], min_overlap: int) -> int:
+    """Length of the longest suffix of `a` that is also a prefix of `b` (0 if shorter than min_overlap)."""
+    if not a or not b:
+        return 0
+    first = b[0]
+    for i in range(max(0, len(a) - len(b)), len(a) - min_overlap + 1):
+        if a[i] == first and a[i:] == b[: len(a) - i]:
+            return len(a) - i
+    return 0
+
+
+def build_context(texts: List[str], max_tokens: int = QA_CONTEXT_TOKENS, min_overlap: int = 8) -> str:
+    """Join retrieved chunks into one prompt context of at most `max_tokens` tokens.
+
+    Neighbouring chunks from `chunk_text` share their overlap words; chunks
+    that overlap by at least `min_overlap` tokens are merged so the shared
+    text appears once. Pieces keep the rank order of their best chunk, and
+    the budget is filled in that order.
+    """
+    pieces = []
+    for text in texts:
+        words = text.split()
+        if not words:
+            continue
+        pos = len(pieces)
+        # a merged piece may now bridge two others, so keep merging
+        merged = True
+        while merged:
+            merged = False
+            for i, p in enumerate(pieces):
+                k = _overlap(p, words, min_overlap)
+                if k:
+                    words = p + words[k:]
+                else:
+                    k = _overlap(words, p, min_overlap)
+                    if not k:
+                        continue
+                    words = words + p[k:]
+                del pieces[i]
+                pos = min(pos, i)
+                merged = True
+                break
+        pieces.insert(pos, words)
+
+    out = []
+    budget = max_tokens
+    for words in pieces:
+        if budget <= 0:
+            break
+        out.append(" ".join(words[:budget]))
+        budget -= len(words)
+    return "\n\n---\n\n".join(out)
 
 
 class LlamaQA:
-    def __init__(self, index: InMemoryIndex, model: str = None):
+    """Retrieval-augmented answers from the index and the shared Ollama scheduler.
+
+    Answers are cached by (model, prompt version, retrieved chunk ids and
+    prompt), so a repeated question over an unchanged index costs a lookup.
+    Pass `answer_cache=False` to always call the model.
+    """
+
+    def __init__(self, index: "InMemoryIndex", model: str = None, max_context_tokens: int = QA_CONTEXT_TOKENS, answer_cache=None):
         self.index = index
         self.model = model or OLLAMA_MODEL
+        self.max_context_tokens = max_context_tokens
+        if answer_cache is None:
+            answer_cache = get_answer_cache()
+        self.answer_cache = answer_cache or None
 
-    def answer(self, question: str, top_k: int = 5) -> str:
-        # retrieve
-        results = self.index.query(question, top_k=top_k)
-        context = "\n\n---\n\n".join([r[2] for r in results])
-
-        prompt = f"""
+    def _prompt(self, question: str, results) -> str:
+        context = build_context([r[2] for r in results], self.max_context_tokens)
+        return f"""
 Use the following extracted document context to answer the question. If the answer is not contained, say you don't know.
 
 Context:
@@ -25,16 +95,114 @@ Context:
 Question: {question}
 """
 
+    @staticmethod
+    def _cache_text(results, prompt: str) -> str:
+        return ",".join(str(r[0]) for r in results) + "\0" + prompt
+
+    def _cached(self, key_text):
+        if self.answer_cache is None:
+            return None
+        return self.answer_cache.get(self.model, PROMPT_VERSION, key_text)
+
+    def _store(self, key_text, content):
+        if self.answer_cache is not None and content:
+            self.answer_cache.put(self.model, PROMPT_VERSION, key_text, content)
+
+    def answer(self, question: str, top_k: int = 3) -> str:
+        # retrieve: dense + BM25 fused, so fewer chunks cover the question
+        results = self.index.query(question, top_k=top_k, hybrid=True)
+        prompt = self._prompt(question, results)
+        key_text = self._cache_text(results, prompt)
+        content = self._cached(key_text)
+        if content is not None:
+            return content
+
         try:
-            resp = ollama.chat(model=self.model, messages=[{"role": "user", "content": prompt}])
-            return resp.get("message", {}).get("content", "")
+            resp = get_scheduler().chat(
+                [{"role": "user", "content": prompt}], model=self.model, priority=PRIORITY_INTERACTIVE
+            )
+            content = resp.get("message", {}).get("content", "")
         except Exception:
             logging.exception("Llama query failed")
             return ""
+        self._store(key_text, content)
+        return content
+
+    def answer_stream(self, question: str, top_k: int = 3) -> Iterator[str]:
+        """Like `answer`, but yield the reply text as the model produces it.
+
+        A cached answer is yielded in one piece. Only complete replies are cached.
+        """
+        results = self.index.query(question, top_k=top_k, hybrid=True)
+        prompt = self._prompt(question, results)
+        key_text = self._cache_text(results, prompt)
+        content = self._cached(key_text)
+        if content is not None:
+            yield content
+            return
+
+        parts = []
+        try:
+            for piece in get_scheduler().stream(
+                [{"role": "user", "content": prompt}], model=self.model, priority=PRIORITY_INTERACTIVE
+            ):
+                parts.append(piece)
+                yield piece
+        except Exception:
+            logging.exception("Llama query failed")
+            return
+        self._store(key_text, "".join(parts))
+
+    def answer_many(self, questions: List[str], top_k: int = 3) -> List[str]:
+        """Answer many questions: one batched retrieval, LLM calls queued together.
+
+        Calls run at bulk priority, so interactive `answer` calls still go first.
+        """
+        retrieved = self.index.query_batch(questions, top_k=top_k, hybrid=True)
+        scheduler = get_scheduler()
+        jobs = []
+        for q, results in zip(questions, retrieved):
+            prompt = self._prompt(q, results)
+            key_text = self._cache_text(results, prompt)
+            content = self._cached(key_text)
+            if content is not None:
+                jobs.append((key_text, content))
+            else:
+                fut = scheduler.submit([{"role": "user", "content": prompt}], model=self.model, priority=PRIORITY_BULK)
+                jobs.append((key_text, fut))
+        answers = []
+        for q, (key_text, job) in zip(questions, jobs):
+            if isinstance(job, str):
+                answers.append(job)
+                continue
+            try:
+                content = job.result().get("message", {}).get("content", "")
+            except Exception:
+                logging.exception("Llama query failed for: %s", q)
+                content = ""
+            self._store(key_text, content)
+            answers.append(content)
+        return answers
+
+
+def ask_server(question: str, top_k: int = 3, host: str = QA_SERVER_HOST, port: int = QA_SERVER_PORT) -> Iterator[str]:
+    """Stream an answer from a running qa_server; raises requests.ConnectionError if none is up."""
+    resp = requests.post(
+        "http://%s:%d/answer" % (host, port),
+        json={"question": question, "top_k": top_k, "stream": True},
+        stream=True,
+        timeout=(1, None),
+    )
+    resp.raise_for_status()
+    resp.encoding = "utf-8"
+    for piece in resp.iter_content(chunk_size=None, decode_unicode=True):
+        if piece:
+            yield piece
 
 
 if __name__ == "__main__":
-    # demo usage (requires built index)
+    # Asks the resident server (python qa_server.py) when it is running, which
+    # skips loading the model and index; otherwise answers locally.
     import sys
 
     if len(sys.argv) < 2:
@@ -42,7 +210,18 @@ if __name__ == "__main__":
         raise SystemExit(1)
 
     q = sys.argv[1]
-    idx = InMemoryIndex()
-    idx.load("data/emb_index")
-    qa = LlamaQA(idx)
-    print(qa.answer(q))
+    try:
+        pieces = ask_server(q)
+        first = next(pieces, "")
+    except requests.ConnectionError:
+        from config import QA_INDEX_PATH
+        from embed_index import InMemoryIndex
+
+        idx = InMemoryIndex()
+        idx.load(QA_INDEX_PATH)
+        pieces = LlamaQA(idx).answer_stream(q)
+        first = ""
+    print(first, end="", flush=True)
+    for piece in pieces:
+        print(piece, end="", flush=True)
+    print()
@@ -0,0 +1,150 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from config import OLLAMA_MODEL, LLM_CACHE_PATH, LLM_CACHE_MAX_BYTES, QA_CACHE_PATH
+from llm_client import chat
+import metrics
+
+
+def _key(model, prompt_version, text):
+    text_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return hashlib.sha256(("%s\0%s\0%s" % (model, prompt_version, text_hash)).encode("utf-8")).hexdigest()
+
+
+class ExtractionCache:
+    """SQLite-backed cache of raw LLM extraction responses.
+
+    Keyed by (model, prompt template version, hash of the input text), so an
+    identical snippet returned for different queries or URLs costs a lookup
+    instead of an LLM call. Bump an extractor's prompt version whenever its
+    template changes. Least recently used entries are evicted once the
+    stored responses exceed `max_bytes`.
+    """
+
+    def __init__(self, path: str = LLM_CACHE_PATH, max_bytes: int = LLM_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS extractions (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    prompt_version TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    accessed_at REAL NOT NULL
+                )"""
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS extractions_accessed ON extractions (accessed_at)")
+        self._bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM extractions").fetchone()[0]
+
+    def get(self, model, prompt_version, text) -> Optional[str]:
+        key = _key(model, prompt_version, text)
+        with self._lock:
+            row = self._db.execute("SELECT content FROM extractions WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            with self._db:
+                self._db.execute("UPDATE extractions SET accessed_at = ? WHERE key = ?", (time.time(), key))
+        return row[0]
+
+    def put(self, model, prompt_version, text, content):
+        key = _key(model, prompt_version, text)
+        size = len(content.encode("utf-8"))
+        with self._lock, self._db:
+            old = self._db.execute("SELECT size FROM extractions WHERE key = ?", (key,)).fetchone()
+            self._db.execute(
+                """
+                INSERT OR REPLACE INTO extractions (key, model, prompt_version, content, size, accessed_at)
+                VALUES (?, ?, ?, ?, ?, ?)""",
+                (key, model, prompt_version, content, size, time.time()),
+            )
+            self._bytes += size - (old[0] if old else 0)
+            if self._bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Caller holds the lock and an open transaction.
+        rows = self._db.execute("SELECT key, size FROM extractions ORDER BY accessed_at").fetchall()
+        doomed = []
+        for key, size in rows:
+            if self._bytes <= self.max_bytes:
+                break
+            doomed.append((key,))
+            self._bytes -= size
+        self._db.executemany("DELETE FROM extractions WHERE key = ?", doomed)
+        logging.debug("LLM cache evicted %d entries", len(doomed))
+
+    def stats(self):
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM extractions").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "entries": entries,
+                "bytes": self._bytes,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_extraction_cache():
+    """Return the extraction cache shared by every engine."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ExtractionCache()
+        return _cache
+
+
+_answer_cache = None
+
+
+def get_answer_cache():
+    """Return the cache of LlamaQA answers (same format, separate file)."""
+    global _answer_cache
+    with _cache_lock:
+        if _answer_cache is None:
+            _answer_cache = ExtractionCache(QA_CACHE_PATH)
+        return _answer_cache
+
+
+def cached_chat(prompt_version, prompt, text, model=None):
+    """Return the model's reply to `prompt + text`, consulting the cache first.
+
+    The cache key covers only the model, `prompt_version` and `text`; any
+    per-call values interpolated into `prompt` (such as the page URL) must be
+    overwritten by the caller after parsing.
+    """
+    model = model or OLLAMA_MODEL
+    cache = get_extraction_cache()
+    content = cache.get(model, prompt_version, text)
+    if content is not None:
+        metrics.inc("llm_cache_hits")
+        return content
+    metrics.inc("llm_cache_misses")
+    with metrics.timer("llm_extract"):
+        response = chat([{"role": "user", "content": prompt + text}], model=model)
+    content = response.get("message", {}).get("content", "")
+    if content:
+        cache.put(model, prompt_version, text, content)
+    return content
@@ -0,0 +1,224 @@
+import itertools
+import logging
+import queue
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import ollama
+import metrics
+from config import (
+    OLLAMA_MODEL,
+    OLLAMA_HOST,
+    LLM_MAX_IN_FLIGHT,
+    LLM_TIMEOUT,
+    LLM_RETRIES,
+    LLM_RETRY_BACKOFF,
+)
+
+# Lower runs first: interactive QA jumps ahead of queued bulk extraction.
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 10
+
+
+def _retryable(exc):
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        # Connection errors, read timeouts and the like.
+        return True
+    return status == 429 or status >= 500
+
+
+class _Job:
+    __slots__ = ("model", "messages", "options", "future", "enqueued_at", "sink")
+
+    def __init__(self, model, messages, options, sink=None):
+        self.model = model
+        self.messages = messages
+        self.options = options
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+        # for streamed calls: receives reply pieces, then None
+        self.sink = sink
+
+
+class LLMScheduler:
+    """Single entry point for Ollama chat calls.
+
+    Requests go into a priority queue served by `workers` threads, which
+    bounds how many calls are in flight against the Ollama server at once
+    (set it to match the server's OLLAMA_NUM_PARALLEL so it batches them).
+    Each call has a timeout and is retried with exponential backoff on
+    connection errors, 429s and 5xx responses; a streamed call is only
+    retried if it failed before its first token.
+    """
+
+    def __init__(
+        self,
+        host: str = OLLAMA_HOST,
+        workers: int = LLM_MAX_IN_FLIGHT,
+        timeout: float = LLM_TIMEOUT,
+        retries: int = LLM_RETRIES,
+        backoff: float = LLM_RETRY_BACKOFF,
+    ):
+        self.client = ollama.Client(host=host, timeout=timeout)
+        self.workers = max(1, workers)
+        self.retries = max(0, retries)
+        self.backoff = backoff
+        self._queue = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._threads = []
+        self._start_lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+        self._in_flight = 0
+        self._counts = {"submitted": 0, "completed": 0, "failed": 0, "retries": 0}
+        self._latencies = deque(maxlen=1000)
+        self._waits = deque(maxlen=1000)
+        self._first_tokens = deque(maxlen=1000)
+
+    def _start(self):
+        with self._start_lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._run, name="llm-worker-%d" % i, daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def submit(self, messages, model=None, priority=PRIORITY_BULK, **options) -> Future:
+        """Queue a chat request and return a Future for the response."""
+        return self._submit(_Job(model or OLLAMA_MODEL, messages, options), priority).future
+
+    def _submit(self, job, priority):
+        self._start()
+        with self._metrics_lock:
+            self._counts["submitted"] += 1
+        self._queue.put((priority, next(self._seq), job))
+        return job
+
+    def stream(self, messages, model=None, priority=PRIORITY_INTERACTIVE, **options):
+        """Queue a chat request and yield the reply text piece by piece as it arrives.
+
+        Raises the call's exception, if any, once the pieces run out.
+        """
+        job = self._submit(_Job(model or OLLAMA_MODEL, messages, options, sink=queue.Queue()), priority)
+        while True:
+            piece = job.sink.get()
+            if piece is None:
+                break
+            yield piece
+        job.future.result()
+
+    def chat(self, messages, model=None, priority=PRIORITY_BULK, timeout=None, **options):
+        """Blocking chat call routed through the scheduler."""
+        return self.submit(messages, model=model, priority=priority, **options).result(timeout=timeout)
+
+    def _run(self):
+        while True:
+            _, _, job = self._queue.get()
+            if job is None:
+                return
+            if not job.future.set_running_or_notify_cancel():
+                continue
+            start = time.monotonic()
+            with self._metrics_lock:
+                self._in_flight += 1
+                self._waits.append(start - job.enqueued_at)
+            try:
+                job.future.set_result(self._call(job))
+                with self._metrics_lock:
+                    self._counts["completed"] += 1
+            except Exception as e:
+                job.future.set_exception(e)
+                with self._metrics_lock:
+                    self._counts["failed"] += 1
+            finally:
+                elapsed = time.monotonic() - start
+                with self._metrics_lock:
+                    self._in_flight -= 1
+                    self._latencies.append(elapsed)
+                metrics.observe("llm_call", elapsed)
+                if job.sink is not None:
+                    job.sink.put(None)
+
+    def _call(self, job):
+        attempt = 0
+        while True:
+            emitted = False
+            try:
+                if job.sink is None:
+                    return self.client.chat(model=job.model, messages=job.messages, **job.options)
+                parts = []
+                start = time.monotonic()
+                for chunk in self.client.chat(model=job.model, messages=job.messages, stream=True, **job.options):
+                    piece = chunk.get("message", {}).get("content", "")
+                    if not piece:
+                        continue
+                    if not emitted:
+                        emitted = True
+                        with self._metrics_lock:
+                            self._first_tokens.append(time.monotonic() - start)
+                    parts.append(piece)
+                    job.sink.put(piece)
+                return {"message": {"role": "assistant", "content": "".join(parts)}}
+            except Exception as e:
+                if emitted or attempt >= self.retries or not _retryable(e):
+                    raise
+                delay = self.backoff * (2 ** attempt) * (1 + random.random() * 0.25)
+                attempt += 1
+                with self._metrics_lock:
+                    self._counts["retries"] += 1
+                logging.warning("LLM call failed (%s); retry %d/%d in %.1fs", e, attempt, self.retries, delay)
+                time.sleep(delay)
+
+    def metrics(self):
+        """Queue depth, in-flight count, call counters and latency percentiles (seconds)."""
+        with self._metrics_lock:
+            latencies = sorted(self._latencies)
+            waits = sorted(self._waits)
+            first_tokens = sorted(self._first_tokens)
+            out = dict(self._counts)
+            out["in_flight"] = self._in_flight
+        out["queue_depth"] = self._queue.qsize()
+        out["latency_p50"] = _percentile(latencies, 0.50)
+        out["latency_p95"] = _percentile(latencies, 0.95)
+        out["queue_wait_p50"] = _percentile(waits, 0.50)
+        out["queue_wait_p95"] = _percentile(waits, 0.95)
+        out["first_token_p50"] = _percentile(first_tokens, 0.50)
+        out["first_token_p95"] = _percentile(first_tokens, 0.95)
+        return out
+
+    def close(self):
+        for _ in self._threads:
+            # Sentinels sort after every real request.
+            self._queue.put((float("inf"), next(self._seq), None))
+        for t in self._threads:
+            t.join()
+        self._threads = []
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    i = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return round(sorted_values[i], 4)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Return the scheduler shared by the extractors and LlamaQA."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = LLMScheduler()
+        return _scheduler
+
+
+def chat(messages, model=None, priority=PRIORITY_BULK, **options):
+    """Convenience wrapper: `ollama.chat` through the shared scheduler."""
+    return get_scheduler().chat(messages, model=model, priority=priority, **options)
@@ -1,91 +1,96 @@
 import logging
-import requests
-from bs4 import BeautifulSoup
-from config import TAVILY_API_KEY
+from config import TAVILY_API_KEY, PAGE_MAX_BYTES
+from http_cache import get_cache
+from llm_cache import get_extraction_cache
+from llm_client import get_scheduler
+from page_parser import parse_page
 from research_engine import generate_queries, extract_structured, auto_download_pdfs
-from market_engine import run_market_research
-from supplier_engine import run_vendor_research
-from tavily import TavilyClient
-from db import init_db, insert_intelligence, fetch_all
+from market_engine import market_spec
+from supplier_engine import vendor_spec
+from pipeline import EngineSpec, run_pipeline
+from db import init_db, known_urls
 from report_generator import export_csv
+import metrics
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
 
-if TAVILY_API_KEY:
-    tavily = TavilyClient(api_key=TAVILY_API_KEY)
-else:
-    tavily = None
+if not TAVILY_API_KEY:
     logging.warning("TAVILY_API_KEY not set; Tavily searches disabled.")
 
 
 def scrape(url):
     try:
         headers = {"User-Agent": "Mozilla/5.0"}
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        html = response.text
-        
+        # Read at most PAGE_MAX_BYTES of the body, so a huge page costs
+        # bounded memory and parse time.
+        with metrics.timer("fetch"):
+            response = get_cache().get(url, headers=headers, timeout=10, max_bytes=PAGE_MAX_BYTES)
+            html = response.text
+        if response.truncated:
+            metrics.inc("pages_truncated")
+            logging.debug("Page truncated at %d bytes: %s", PAGE_MAX_BYTES, url)
+
+        # One parse gives the text (capped at PAGE_MAX_CHARS for downstream
+        # processors), the outbound links and the PDF links.
+        with metrics.timer("parse"):
+            page = parse_page(html, url)
+
         # Auto-download PDFs found on this page
-        auto_download_pdfs(html, url)
-        
-        soup = BeautifulSoup(html, "html.parser")
-        text = soup.get_text(separator=" ", strip=True)
-        # Limit size sent to downstream processors
-        return text[:20000]
+        auto_download_pdfs(html, url, pdf_links=page.pdf_links)
+        return page.text
     except Exception as e:
         logging.exception("Scrape failed for %s", url)
         return None
 
 
+def fetch_research_page(result):
+    url = result["url"]
+    logging.info("Scraping: %s", url)
+    return scrape(url)
+
+
+def has_title_or_url(structured):
+    # Basic validation
+    if not structured.get("title") and not structured.get("url"):
+        logging.warning("Extracted structure missing title/url; skipping.")
+        return False
+    return True
+
+
+def research_spec(product):
+    """Pipeline spec for academic research: scrape each result page."""
+    return EngineSpec(
+        name="research",
+        source_type="paper",
+        queries=generate_queries(product),
+        max_results=2,
+        fetch=fetch_research_page,
+        extract=extract_structured,
+        accept=has_title_or_url,
+    )
+
+
 def run_research(product):
-    queries = generate_queries(product)
-
-    for query in queries:
-        logging.info("Searching: %s", query)
-        if not tavily:
-            logging.error("Tavily client unavailable; skipping search.")
-            return
-        results = tavily.search(query=query, max_results=2)
-
-        for r in results.get("results", []):
-            url = r["url"]
-            logging.info("Scraping: %s", url)
-
-            page_text = scrape(url)
-            if not page_text:
-                continue
-
-            try:
-                structured = extract_structured(page_text, url)
-                # Basic validation
-                if not structured.get("title") and not structured.get("url"):
-                    logging.warning("Extracted structure missing title/url; skipping.")
-                    continue
-                insert_intelligence(structured)
-                logging.info("Inserted into DB: %s", structured.get("title"))
-            except Exception as e:
-                logging.exception("Extraction failed for %s", url)
+    return run_pipeline([research_spec(product)])
 
 
 def main():
     logging.info("Initializing Database...")
     init_db()
-
-    logging.info("Running Research Engine...")
-    run_research("Cordyceps militaris")
-
-    logging.info("Running Market Research Engine...")
-    run_market_research("Cordyceps militaris")
-
-    logging.info("Running Vendor/Supplier Research Engine...")
-    run_vendor_research("Cordyceps militaris")
+    # Pages stored by earlier runs are skipped before scraping/extraction.
+    known_urls.load()
+
+    # Research, market and vendor engines share one pipeline so their
+    # searches, page fetches and LLM calls overlap.
+    logging.info("Running Research, Market and Vendor/Supplier Engines...")
+    product = "Cordyceps militaris"
+    run_pipeline([research_spec(product), market_spec(product), vendor_spec(product)])
+    logging.info("LLM extraction cache: %s", get_extraction_cache().stats())
+    logging.info("LLM scheduler: %s", get_scheduler().metrics())
+    metrics.write_run_metrics()
 
     logging.info("Research run complete. Exporting CSV...")
     export_csv()
-    # Optional: display rows
-    rows = fetch_all()
-    for row in rows:
-        logging.debug(row)
 
 
 
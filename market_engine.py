@@ -1,12 +1,13 @@
 import logging
 import json
 import re
-from tavily import TavilyClient
 from config import TAVILY_API_KEY
-import ollama
-from config import OLLAMA_MODEL
-from db import insert_intelligence
+from llm_cache import cached_chat
 from pdf_pipeline import find_pdf_links, download_pdfs, extract_text_from_pdf
+from pipeline import EngineSpec, run_pipeline
+
+# Bump when the extract_market_intelligence prompt changes.
+PROMPT_VERSION = "market-v1"
 
 
 def generate_market_queries(product):
@@ -42,10 +43,7 @@ Only include fields you can confidently extract. If not mentioned, leave blank.
 """ % url
 
     try:
-        response = ollama.chat(
-            model=OLLAMA_MODEL, messages=[{"role": "user", "content": prompt + text[:5000]}]
-        )
-        content = response.get("message", {}).get("content", "")
+        content = cached_chat(PROMPT_VERSION, prompt, text[:5000])
         # Extract JSON
         match = re.search(r"\{.*?\}", content, re.DOTALL)
         if match:
@@ -70,54 +68,59 @@ Only include fields you can confidently extract. If not mentioned, leave blank.
     }
     for k, v in defaults.items():
         data.setdefault(k, v)
+    # (source_type, url) identifies the stored row
+    data["source_type"] = "market_report"
+    data["url"] = url
     return data
 
 
+def fetch_market_content(result):
+    """Use the Tavily snippet as page content and download any PDFs it links."""
+    url = result.get("url", "")
+    content = result.get("content", "")
+
+    if not content:
+        logging.warning("No content for %s", url)
+        return None
+
+    # Auto-download PDFs from this page
+    try:
+        pdf_links = find_pdf_links(content, url)
+        if pdf_links:
+            logging.info("Found %d PDF links on %s", len(pdf_links), url)
+            downloaded = download_pdfs(pdf_links, tag="market")
+            if downloaded:
+                logging.info("Downloaded %d PDFs from market research", len(downloaded))
+            else:
+                logging.warning("Failed to download any of %d found PDFs from %s", len(pdf_links), url)
+        else:
+            logging.debug("No PDF links found in market research page: %s", url)
+    except Exception:
+        logging.exception("Failed to download PDFs from %s", url)
+    return content
+
+
+def has_market_data(market_intel):
+    return bool(market_intel.get("market_size") or market_intel.get("competitors"))
+
+
+def market_spec(product):
+    """Pipeline spec for market intelligence research."""
+    return EngineSpec(
+        name="market",
+        source_type="market_report",
+        queries=generate_market_queries(product),
+        max_results=3,
+        fetch=fetch_market_content,
+        extract=extract_market_intelligence,
+        accept=has_market_data,
+    )
+
+
 def run_market_research(product):
     """Run market intelligence research and store in DB."""
     if not TAVILY_API_KEY:
         logging.warning("TAVILY_API_KEY not set; skipping market research.")
         return
 
-    tavily = TavilyClient(api_key=TAVILY_API_KEY)
-    queries = generate_market_queries(product)
-
-    for query in queries:
-        logging.info("Market search: %s", query)
-        try:
-            results = tavily.search(query=query, max_results=3)
-        except Exception:
-            logging.exception("Tavily search failed for query: %s", query)
-            continue
-
-        for r in results.get("results", []):
-            url = r.get("url", "")
-            content = r.get("content", "")
-
-            if not content:
-                logging.warning("No content for %s", url)
-                continue
-
-            try:
-                market_intel = extract_market_intelligence(content, url)
-                if market_intel.get("market_size") or market_intel.get("competitors"):
-                    # Insert into DB (we'll store as JSON string in summary)
-                    insert_intelligence(market_intel)
-                    logging.info("Inserted market intel: %s", market_intel.get("summary", "")[:100])
-                
-                # Auto-download PDFs from this page
-                try:
-                    pdf_links = find_pdf_links(content, url)
-                    if pdf_links:
-                        logging.info("Found %d PDF links on %s", len(pdf_links), url)
-                        downloaded = download_pdfs(pdf_links, out_dir="pdfs/market")
-                        if downloaded:
-                            logging.info("Downloaded %d PDFs from market research", len(downloaded))
-                        else:
-                            logging.warning("Failed to download any of %d found PDFs from %s", len(pdf_links), url)
-                    else:
-                        logging.debug("No PDF links found in market research page: %s", url)
-                except Exception:
-                    logging.exception("Failed to download PDFs from %s", url)
-            except Exception:
-                logging.exception("Failed to process market data from %s", url)
+    return run_pipeline([market_spec(product)])
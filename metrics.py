@@ -0,0 +1,205 @@
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from config import METRICS_ENABLED, METRICS_DIR, METRICS_PROM_PATH
+
+# Histogram bucket upper bounds in seconds (Prometheus-style, cumulative on export).
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+class Histogram:
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (max for the overflow bucket)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return min(BUCKETS[i], self.max) if i < len(BUCKETS) else self.max
+        return self.max
+
+
+class MetricsRegistry:
+    """Process-wide counters and timing histograms for the pipeline stages.
+
+    Recording is a dict lookup and a few additions under one lock, cheap
+    next to the network, LLM and disk work being timed. `summary()` is a
+    JSON-friendly snapshot; `write_prometheus` writes the text exposition
+    format for node_exporter's textfile collector.
+    """
+
+    def __init__(self, enabled: bool = METRICS_ENABLED):
+        self.enabled = enabled
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    def inc(self, name, n=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def observe(self, name, seconds):
+        if not self.enabled:
+            return
+        with self._lock:
+            h = self._histograms.get(name)
+            if h is None:
+                h = self._histograms[name] = Histogram()
+            h.observe(seconds)
+
+    @contextmanager
+    def timer(self, name):
+        """Time the block as `name`; failures are also counted as `<name>_errors`."""
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.inc(name + "_errors")
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self.started_at = time.time()
+
+    def summary(self):
+        with self._lock:
+            counters = dict(self._counters)
+            stages = {
+                name: {
+                    "count": h.count,
+                    "total_s": round(h.total, 4),
+                    "mean_s": round(h.total / h.count, 4) if h.count else 0.0,
+                    "p50_s": round(h.quantile(0.50), 4),
+                    "p95_s": round(h.quantile(0.95), 4),
+                    "p99_s": round(h.quantile(0.99), 4),
+                    "max_s": round(h.max, 4),
+                }
+                for name, h in self._histograms.items()
+            }
+        return {
+            "started_at": self.started_at,
+            "elapsed_s": round(time.time() - self.started_at, 3),
+            "counters": counters,
+            "stages": stages,
+        }
+
+    def prometheus_text(self, prefix="cordyceps_"):
+        lines = []
+        with self._lock:
+            for name, value in sorted(self._counters.items()):
+                metric = prefix + name + "_total"
+                lines += ["# TYPE %s counter" % metric, "%s %s" % (metric, value)]
+            for name, h in sorted(self._histograms.items()):
+                metric = prefix + name + "_seconds"
+                lines.append("# TYPE %s histogram" % metric)
+                cumulative = 0
+                for bound, n in zip(BUCKETS, h.counts):
+                    cumulative += n
+                    lines.append('%s_bucket{le="%g"} %d' % (metric, bound, cumulative))
+                lines.append('%s_bucket{le="+Inf"} %d' % (metric, h.count))
+                lines.append("%s_sum %.6f" % (metric, h.total))
+                lines.append("%s_count %d" % (metric, h.count))
+        return "\n".join(lines) + "\n"
+
+    def write_summary(self, path=None):
+        """Write `summary()` as JSON; defaults to METRICS_DIR/run-<timestamp>.json."""
+        if path is None:
+            path = os.path.join(METRICS_DIR, time.strftime("run-%Y%m%d-%H%M%S.json", time.localtime(self.started_at)))
+        _write_atomic(path, json.dumps(self.summary(), indent=2))
+        return path
+
+    def write_prometheus(self, path):
+        _write_atomic(path, self.prometheus_text())
+        return path
+
+
+def _write_atomic(path, text):
+    d = os.path.dirname(path)
+    if d:
+        os.makedirs(d, exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """Return the metrics registry shared by every stage."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = MetricsRegistry()
+    return _registry
+
+
+def inc(name, n=1):
+    get_registry().inc(name, n)
+
+
+def observe(name, seconds):
+    get_registry().observe(name, seconds)
+
+
+def timer(name):
+    return get_registry().timer(name)
+
+
+def timed(name):
+    """Decorator form of `timer`."""
+
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timer(name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def write_run_metrics():
+    """Write this run's JSON summary (and the Prometheus file when METRICS_PROM_PATH is set)."""
+    registry = get_registry()
+    if not registry.enabled:
+        return None
+    path = registry.write_summary()
+    if METRICS_PROM_PATH:
+        registry.write_prometheus(METRICS_PROM_PATH)
+    logging.info("Run metrics written to %s", path)
+    return path
@@ -0,0 +1,112 @@
+import re
+from dataclasses import dataclass, field
+from typing import List
+from urllib.parse import urljoin, urldefrag
+
+try:
+    import lxml.html
+    from lxml import etree
+except ImportError:  # falls back to BeautifulSoup's pure-Python parser
+    lxml = None
+
+from config import PAGE_MAX_CHARS
+
+# Elements whose text is not page content (BeautifulSoup's get_text skips them too).
+_SKIP_TAGS = frozenset(("script", "style", "template"))
+_PDF_URL_RE = re.compile(r'https?://[^\s"<>]+\.pdf', re.IGNORECASE)
+
+
+@dataclass
+class Page:
+    """What the pipeline needs from one HTML page, produced by a single parse."""
+
+    url: str
+    text: str = ""
+    links: List[str] = field(default_factory=list)
+    pdf_links: List[str] = field(default_factory=list)
+
+
+def _is_pdf_link(href, type_attr):
+    return urldefrag(href)[0].lower().endswith(".pdf") or "application/pdf" in (type_attr or "")
+
+
+def _lxml_parts(html):
+    """Yield ("text", s) and ("a", href, type) in document order from one lxml parse."""
+    try:
+        root = lxml.html.fromstring(html)
+    except ValueError:
+        # str input with an XML encoding declaration must be given as bytes
+        root = lxml.html.fromstring(html.encode("utf-8"))
+    skip_depth = 0
+    for event, el in etree.iterwalk(root, events=("start", "end")):
+        tag = el.tag if isinstance(el.tag, str) else None
+        if event == "start":
+            if tag in _SKIP_TAGS:
+                skip_depth += 1
+            elif skip_depth == 0:
+                if tag == "a" and el.get("href"):
+                    yield ("a", el.get("href"), el.get("type"))
+                if tag is not None and el.text:
+                    yield ("text", el.text)
+        else:
+            if tag in _SKIP_TAGS:
+                skip_depth -= 1
+            # an element's tail belongs to its parent, so it is visible even after a skipped tag
+            if skip_depth == 0 and el.tail and el is not root:
+                yield ("text", el.tail)
+
+
+def _soup_parts(html):
+    from bs4 import BeautifulSoup, CData, NavigableString
+
+    soup = BeautifulSoup(html, "html.parser")
+    for node in soup.descendants:
+        if isinstance(node, NavigableString):
+            # comments, doctypes and script/style strings are subclasses get_text leaves out
+            if type(node) in (NavigableString, CData) and node.parent.name not in _SKIP_TAGS:
+                yield ("text", str(node))
+        elif node.name == "a" and node.get("href"):
+            yield ("a", node["href"], node.get("type"))
+
+
+def parse_page(html, base_url: str, max_chars: int = PAGE_MAX_CHARS) -> Page:
+    """Parse `html` once into visible text, outbound links and PDF links.
+
+    Uses lxml when it is installed, otherwise BeautifulSoup's html.parser.
+    Text matches `get_text(separator=" ", strip=True)` and stops being
+    collected at `max_chars`; links are absolute, de-duplicated and in page
+    order. PDF links are anchors to `.pdf` (or typed application/pdf) plus
+    PDF URLs written out in the text, as in Tavily snippets.
+    """
+    page = Page(url=base_url)
+    if not html or not html.strip():
+        return page
+
+    pieces = []
+    size = 0
+    links = {}
+    pdfs = {}
+    parts = _lxml_parts(html) if lxml is not None else _soup_parts(html)
+    for part in parts:
+        if part[0] == "a":
+            url = urljoin(base_url, part[1].strip())
+            if not url.startswith(("http://", "https://")):
+                continue
+            links.setdefault(url, None)
+            if _is_pdf_link(url, part[2]):
+                pdfs.setdefault(url, None)
+        else:
+            s = part[1].strip()
+            if not s:
+                continue
+            if size < max_chars:
+                pieces.append(s)
+                size += len(s) + 1
+            if ".pdf" in s.lower():
+                for m in _PDF_URL_RE.finditer(s):
+                    pdfs.setdefault(m.group(0), None)
+
+    page.text = " ".join(pieces)[:max_chars]
+    page.links = list(links)
+    page.pdf_links = list(pdfs)
+    return page
@@ -1,10 +1,21 @@
 import os
 import re
+import json
+import time
 import logging
-from urllib.parse import urljoin, urlparse
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Optional
+from urllib.parse import urlparse
 
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+
+from config import PDF_DOWNLOAD_WORKERS, PDF_MAX_BYTES, PDF_EXTRACT_WORKERS, PDF_TEXT_CACHE_DIR
+from page_parser import parse_page
+from pdf_store import file_sha256, get_store
+import metrics
 
 
 def ensure_dir(path):
@@ -12,23 +23,12 @@ def ensure_dir(path):
 
 
 def find_pdf_links(html, base_url):
-    """Find PDF links in HTML or plain text content."""
-    links = []
-    
-    # Try parsing as HTML first
-    soup = BeautifulSoup(html, "html.parser")
-    for a in soup.find_all("a", href=True):
-        href = a["href"]
-        if href.lower().endswith(".pdf") or "application/pdf" in (a.get("type") or ""):
-            links.append(urljoin(base_url, href))
-    
-    # Also search for PDF URLs in plain text (for Tavily snippets)
-    pdf_urls = re.findall(r'https?://[^\s"<>]+\.pdf', html)
-    for url in pdf_urls:
-        full_url = urljoin(base_url, url)
-        if full_url not in links:
-            links.append(full_url)
-    
+    """Find PDF links in HTML or plain text content (e.g. Tavily snippets).
+
+    Callers that also need the page text should use `page_parser.parse_page`
+    and take its `pdf_links` rather than parsing the page twice.
+    """
+    links = parse_page(html, base_url).pdf_links
     if links:
         logging.info("Found %d PDF links on %s", len(links), base_url)
     else:
@@ -37,61 +37,308 @@ def find_pdf_links(html, base_url):
     return links
 
 
-def download_pdf(url, out_dir="pdfs"):
-    ensure_dir(out_dir)
+@dataclass
+class DownloadResult:
+    """Outcome of one PDF download, with timing and transfer stats."""
+
+    url: str
+    path: Optional[str]
+    status: str
+    bytes: int = 0
+    seconds: float = 0.0
+    resumed: bool = False
+
+    @property
+    def ok(self):
+        return self.path is not None
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+_executor = None
+_executor_lock = threading.Lock()
+_url_locks = [threading.Lock() for _ in range(64)]
+
+
+def get_session(url):
+    """Return the keep-alive session shared by all downloads from url's host."""
+    host = urlparse(url).netloc
+    with _sessions_lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=PDF_DOWNLOAD_WORKERS)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers["User-Agent"] = "Mozilla/5.0"
+            _sessions[host] = session
+        return session
+
+
+def _get_executor():
+    # One pool for the whole process, so concurrent callers share the limit.
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=PDF_DOWNLOAD_WORKERS, thread_name_prefix="pdf-download")
+        return _executor
+
+
+def _read_part_meta(path):
     try:
-        logging.debug("Attempting to download PDF: %s", url)
-        r = requests.get(url, stream=True, timeout=30, headers={"User-Agent": "Mozilla/5.0"})
-        r.raise_for_status()
-        parsed = urlparse(url)
-        name = os.path.basename(parsed.path) or "download.pdf"
-        # sanitize
-        name = re.sub(r"[^0-9A-Za-z._-]", "_", name)
-        out_path = os.path.join(out_dir, name)
-        
-        # Check file size
-        content_length = r.headers.get('content-length')
-        if content_length and int(content_length) > 100*1024*1024:  # >100MB
-            logging.warning("PDF too large (%s bytes), skipping: %s", content_length, url)
-            return None
-        
-        with open(out_path, "wb") as f:
-            for chunk in r.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
-        logging.info("Downloaded PDF: %s", out_path)
-        return out_path
-    except requests.exceptions.HTTPError as e:
-        logging.warning("HTTP error downloading PDF %s: %s", url, e)
-        return None
-    except Exception:
-        logging.exception("Failed to download PDF: %s", url)
-        return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
 
 
-def download_pdfs(urls, out_dir="pdfs"):
-    """Download multiple PDFs, return list of successfully downloaded paths."""
+def _discard(*paths):
+    for p in paths:
+        try:
+            os.remove(p)
+        except FileNotFoundError:
+            pass
+
+
+def fetch_pdf(url, tag=None, max_bytes=PDF_MAX_BYTES):
+    """Download one PDF into the content-addressed store and return a DownloadResult.
+
+    URLs already in the store's manifest are not requested again; the file
+    is just tagged with `tag` (the engine that found it). Otherwise the body
+    is streamed into a `.part` file, abandoned as soon as it exceeds
+    `max_bytes` whether or not the server sent a content-length, and moved
+    into the store only when complete. A `.part` file left by an interrupted
+    download is resumed with a Range request (guarded by If-Range) when the
+    server supplied a validator for it.
+    """
+    start = time.monotonic()
+
+    def result(status, path=None, nbytes=0, resumed=False):
+        seconds = time.monotonic() - start
+        metrics.inc("pdf_" + status)
+        if nbytes:
+            metrics.inc("pdf_bytes", nbytes)
+        if status in ("downloaded", "resumed"):
+            metrics.observe("pdf_download", seconds)
+        return DownloadResult(url, path, status, nbytes, round(seconds, 3), resumed)
+
+    store = get_store()
+    # Serialise work on the same URL (e.g. found by two engines at once).
+    with _url_locks[hash(url) % len(_url_locks)]:
+        try:
+            sha = store.lookup_url(url)
+            if sha:
+                store.add_tag(sha, tag)
+                logging.debug("PDF already stored: %s", url)
+                return result("stored", store.path_for(sha))
+
+            logging.debug("Attempting to download PDF: %s", url)
+            part_path = store.partial_path(url)
+            meta_path = part_path + ".json"
+
+            headers = {}
+            offset = 0
+            part_meta = _read_part_meta(meta_path) if os.path.exists(part_path) else {}
+            validator = part_meta.get("etag") or part_meta.get("last_modified")
+            if validator:
+                offset = os.path.getsize(part_path)
+                headers["Range"] = "bytes=%d-" % offset
+                headers["If-Range"] = validator
+
+            session = get_session(url)
+            r = session.get(url, stream=True, timeout=30, headers=headers)
+            try:
+                if r.status_code == 416:
+                    # Our partial file no longer matches the resource; start over next time.
+                    _discard(part_path, meta_path)
+                    logging.warning("Stale partial download discarded for %s", url)
+                    return result("error")
+                r.raise_for_status()
+
+                resumed = offset > 0 and r.status_code == 206
+                if not resumed:
+                    offset = 0
+
+                # Check file size up front when the server tells us
+                content_length = r.headers.get("content-length")
+                if content_length and offset + int(content_length) > max_bytes:
+                    logging.warning("PDF too large (%s bytes), skipping: %s", offset + int(content_length), url)
+                    _discard(part_path, meta_path)
+                    return result("too_large")
+
+                with open(meta_path, "w", encoding="utf-8") as f:
+                    json.dump({"etag": r.headers.get("ETag"), "last_modified": r.headers.get("Last-Modified")}, f)
+
+                written = offset
+                received = 0
+                with open(part_path, "ab" if resumed else "wb") as f:
+                    for chunk in r.iter_content(chunk_size=64 * 1024):
+                        if not chunk:
+                            continue
+                        written += len(chunk)
+                        received += len(chunk)
+                        if written > max_bytes:
+                            break
+                        f.write(chunk)
+                if written > max_bytes:
+                    logging.warning("PDF exceeded %d bytes while streaming, skipping: %s", max_bytes, url)
+                    _discard(part_path, meta_path)
+                    return result("too_large", nbytes=received)
+            finally:
+                r.close()
+
+            # Moving into the store is an atomic rename within the same filesystem.
+            sha = store.add_file(part_path, url=url, tag=tag)
+            _discard(meta_path)
+            path = store.path_for(sha)
+            logging.info("Downloaded PDF: %s -> %s", url, path)
+            return result("resumed" if resumed else "downloaded", path, received, resumed)
+        except requests.exceptions.HTTPError as e:
+            logging.warning("HTTP error downloading PDF %s: %s", url, e)
+            return result("error")
+        except Exception:
+            # Any .part file is kept so the next attempt can resume it.
+            logging.exception("Failed to download PDF: %s", url)
+            return result("error")
+
+
+def download_pdf(url, tag=None):
+    return fetch_pdf(url, tag=tag).path
+
+
+def fetch_pdfs(urls, tag=None):
+    """Download PDFs concurrently; return a DownloadResult per unique URL."""
+    urls = list(dict.fromkeys(urls or []))
     if not urls:
         logging.debug("No PDFs to download.")
         return []
-    
-    results = []
-    for u in urls:
-        p = download_pdf(u, out_dir=out_dir)
-        if p:
-            results.append(p)
+
+    start = time.monotonic()
+    executor = _get_executor()
+    results = list(executor.map(lambda u: fetch_pdf(u, tag=tag), urls))
+    elapsed = time.monotonic() - start
+    total = sum(r.bytes for r in results)
+    logging.info(
+        "Fetched %d/%d PDFs (%d already stored) for %s: %.1f MB in %.1fs",
+        sum(1 for r in results if r.ok),
+        len(results),
+        sum(1 for r in results if r.status == "stored"),
+        tag or "untagged",
+        total / 1e6,
+        elapsed,
+    )
     return results
 
 
+def download_pdfs(urls, tag=None):
+    """Download multiple PDFs, return list of successfully downloaded paths."""
+    return [r.path for r in fetch_pdfs(urls, tag=tag) if r.ok]
+
+
+def iter_pdf_pages(path):
+    """Yield the extracted text of each page of a PDF, one page at a time."""
+    from pypdf import PdfReader
+
+    reader = PdfReader(path)
+    for page in reader.pages:
+        yield page.extract_text() or ""
+
+
+_SHA256_RE = re.compile(r"[0-9a-f]{64}")
+
+
+def pdf_content_key(path):
+    """SHA-256 of the file; free for store files, which are named by it."""
+    stem, ext = os.path.splitext(os.path.basename(path))
+    if ext == ".pdf" and _SHA256_RE.fullmatch(stem):
+        return stem
+    return file_sha256(path)
+
+
+def _text_cache_path(key):
+    return os.path.join(PDF_TEXT_CACHE_DIR, key[:2], key + ".jsonl")
+
+
+def _extract_to_cache(path, key):
+    """Parse a PDF and write its pages to the text cache (runs in worker processes).
+
+    Returns (pages, seconds) so the parent can record the timing.
+    """
+    start = time.perf_counter()
+    out = _text_cache_path(key)
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    tmp = "%s.%d.tmp" % (out, os.getpid())
+    n = 0
+    with open(tmp, "w", encoding="utf-8") as f:
+        for text in iter_pdf_pages(path):
+            f.write(json.dumps(text))
+            f.write("\n")
+            n += 1
+    os.replace(tmp, out)
+    return n, time.perf_counter() - start
+
+
+def _record_extraction(pages, seconds):
+    metrics.observe("pdf_extract", seconds)
+    metrics.inc("pdf_pages_extracted", pages)
+
+
+def _cached_pages(path, key):
+    with open(_text_cache_path(key), "r", encoding="utf-8") as f:
+        for i, line in enumerate(f):
+            yield path, i, json.loads(line)
+
+
+def iter_corpus_pages(paths, workers=PDF_EXTRACT_WORKERS):
+    """Yield (path, page_number, text) for every page of every PDF.
+
+    Text is cached per file content hash, so only new or changed PDFs are
+    parsed; those are parsed in a pool of `workers` processes. Pages of one
+    file are yielded together, files in completion order, and each page is
+    read back from the cache so at most one line is held in memory.
+    """
+    pending = []
+    cached = 0
+    for path in paths:
+        try:
+            key = pdf_content_key(path)
+        except OSError:
+            logging.exception("Cannot read PDF %s", path)
+            continue
+        if os.path.exists(_text_cache_path(key)):
+            cached += 1
+            yield from _cached_pages(path, key)
+        else:
+            pending.append((path, key))
+    if not pending:
+        return
+
+    logging.info("Extracting text from %d PDFs (%d cached)", len(pending), cached)
+    if workers <= 1 or len(pending) == 1:
+        for path, key in pending:
+            try:
+                _record_extraction(*_extract_to_cache(path, key))
+            except Exception:
+                logging.exception("PDF text extraction failed for %s", path)
+                continue
+            yield from _cached_pages(path, key)
+        return
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(pending))) as pool:
+        futures = {pool.submit(_extract_to_cache, path, key): (path, key) for path, key in pending}
+        for fut in as_completed(futures):
+            path, key = futures[fut]
+            try:
+                _record_extraction(*fut.result())
+            except Exception:
+                logging.exception("PDF text extraction failed for %s", path)
+                continue
+            yield from _cached_pages(path, key)
+
+
 def extract_text_from_pdf(path):
     try:
-        from pypdf import PdfReader
-
-        reader = PdfReader(path)
-        texts = []
-        for page in reader.pages:
-            texts.append(page.extract_text() or "")
-        return "\n".join(texts)
+        return "\n".join(text for _, _, text in iter_corpus_pages([path], workers=1))
     except Exception:
         logging.exception("PDF text extraction failed for %s", path)
         return ""
@@ -0,0 +1,204 @@
+import hashlib
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import List, Optional
+
+from config import PDF_STORE_DIR, PDF_MANIFEST_PATH
+
+
+@dataclass
+class StoredPdf:
+    sha256: str
+    path: str
+    size: int
+    pages: Optional[int]
+    tags: List[str]
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def count_pages(path):
+    try:
+        from pypdf import PdfReader
+
+        return len(PdfReader(path).pages)
+    except Exception:
+        logging.debug("Could not count pages of %s", path)
+        return None
+
+
+class PdfStore:
+    """Content-addressed PDF storage with a SQLite manifest.
+
+    Files live at `root/<sha[:2]>/<sha>.pdf`, so the same PDF found by
+    several engines or under several URLs is stored once. The manifest maps
+    URL -> SHA-256 and records each file's size, page count and the engines
+    (tags) that found it, so downloads can be skipped for known URLs and the
+    corpus can be listed without walking directories.
+    """
+
+    def __init__(self, root: str = PDF_STORE_DIR, manifest: str = PDF_MANIFEST_PATH):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        d = os.path.dirname(manifest)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(manifest, check_same_thread=False)
+        with self._db:
+            self._db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS files (
+                    sha256 TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    pages INTEGER,
+                    added_at REAL NOT NULL
+                )"""
+            )
+            self._db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS urls (
+                    url TEXT PRIMARY KEY,
+                    sha256 TEXT NOT NULL,
+                    fetched_at REAL NOT NULL
+                )"""
+            )
+            self._db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS tags (
+                    sha256 TEXT NOT NULL,
+                    tag TEXT NOT NULL,
+                    PRIMARY KEY (sha256, tag)
+                )"""
+            )
+
+    def path_for(self, sha256):
+        return os.path.join(self.root, sha256[:2], sha256 + ".pdf")
+
+    def partial_path(self, url):
+        """Where an in-progress download of `url` is kept until it completes."""
+        d = os.path.join(self.root, ".partial")
+        os.makedirs(d, exist_ok=True)
+        return os.path.join(d, hashlib.sha1(url.encode("utf-8")).hexdigest() + ".part")
+
+    def lookup_url(self, url) -> Optional[str]:
+        """Return the SHA-256 stored for `url` if its file is still present."""
+        with self._lock:
+            row = self._db.execute("SELECT sha256 FROM urls WHERE url = ?", (url,)).fetchone()
+        if row and os.path.exists(self.path_for(row[0])):
+            return row[0]
+        return None
+
+    def add_tag(self, sha256, tag):
+        if not tag:
+            return
+        with self._lock, self._db:
+            self._db.execute("INSERT OR IGNORE INTO tags (sha256, tag) VALUES (?, ?)", (sha256, tag))
+
+    def add_file(self, src_path, url=None, tag=None) -> str:
+        """Move a downloaded file into the store and record it; return its hash."""
+        sha = file_sha256(src_path)
+        dest = self.path_for(sha)
+        size = os.path.getsize(src_path)
+        if os.path.exists(dest):
+            os.remove(src_path)
+            pages = None
+        else:
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            os.replace(src_path, dest)
+            pages = count_pages(dest)
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR IGNORE INTO files (sha256, size, pages, added_at) VALUES (?, ?, ?, ?)",
+                (sha, size, pages, now),
+            )
+            if url:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO urls (url, sha256, fetched_at) VALUES (?, ?, ?)",
+                    (url, sha, now),
+                )
+            if tag:
+                self._db.execute("INSERT OR IGNORE INTO tags (sha256, tag) VALUES (?, ?)", (sha, tag))
+        return sha
+
+    def import_dir(self, directory, tag=None, move=False) -> List[str]:
+        """Add every *.pdf directly in `directory` to the store, tagged `tag`.
+
+        For PDFs downloaded before the store existed. Files are copied
+        (hard-linked where possible) unless `move` is set. Returns their hashes.
+        """
+        hashes = []
+        for name in sorted(os.listdir(directory)):
+            src = os.path.join(directory, name)
+            if not name.lower().endswith(".pdf") or not os.path.isfile(src):
+                continue
+            if not move:
+                tmp = os.path.join(self.root, ".import.%d.tmp" % os.getpid())
+                try:
+                    os.link(src, tmp)
+                except OSError:
+                    shutil.copyfile(src, tmp)
+                src = tmp
+            hashes.append(self.add_file(src, tag=tag))
+        logging.info("Imported %d PDFs from %s", len(hashes), directory)
+        return hashes
+
+    def files(self, tag=None) -> List[StoredPdf]:
+        """List stored PDFs, optionally only those found by engine `tag`."""
+        sql = """
+            SELECT f.sha256, f.size, f.pages, GROUP_CONCAT(t.tag)
+            FROM files f LEFT JOIN tags t ON t.sha256 = f.sha256
+        """
+        params = ()
+        if tag:
+            sql += " WHERE f.sha256 IN (SELECT sha256 FROM tags WHERE tag = ?)"
+            params = (tag,)
+        sql += " GROUP BY f.sha256 ORDER BY f.added_at"
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+        return [
+            StoredPdf(sha, self.path_for(sha), size, pages, sorted(tags.split(",")) if tags else [])
+            for sha, size, pages, tags in rows
+        ]
+
+    def paths(self, tag=None) -> List[str]:
+        return [f.path for f in self.files(tag)]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Return the PDF store shared by every engine."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = PdfStore()
+        return _store
+
+
+if __name__ == "__main__":
+    # list the corpus: python pdf_store.py [tag]
+    # import a directory of PDFs: python pdf_store.py import <dir> [tag]
+    import sys
+
+    if sys.argv[1:2] == ["import"]:
+        logging.basicConfig(level=logging.INFO)
+        get_store().import_dir(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None)
+        sys.exit()
+    tag = sys.argv[1] if len(sys.argv) > 1 else None
+    for f in get_store().files(tag):
+        print(f.sha256, f.size, f.pages, ",".join(f.tags), f.path)
@@ -0,0 +1,233 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+from config import (
+    SEARCH_CONCURRENCY,
+    FETCH_CONCURRENCY,
+    LLM_CONCURRENCY,
+    DB_CONCURRENCY,
+    PIPELINE_QUEUE_SIZE,
+)
+from db import get_writer, known_urls
+from search_service import SearchService, get_search_service
+
+
+def _accept_all(record):
+    return True
+
+
+@dataclass
+class EngineSpec:
+    """Describes how one research engine feeds the pipeline.
+
+    `fetch` turns a Tavily search result into the text handed to `extract`
+    (returning None drops the result), `extract` turns (text, url) into a
+    record, and `accept` decides whether that record is written to the DB.
+    `source_type` is the value `extract` stores, used to skip known pages.
+    """
+
+    name: str
+    source_type: str
+    queries: List[str]
+    max_results: int
+    fetch: Callable[[dict], Optional[str]]
+    extract: Callable[[str, str], dict]
+    accept: Callable[[dict], bool] = _accept_all
+
+
+class Pipeline:
+    """Staged search -> fetch -> extract -> write pipeline.
+
+    Each stage has its own bounded input queue and its own thread pool, so a
+    slow stage (usually the LLM) applies back-pressure upstream instead of
+    letting fetched pages pile up in memory, while the other stages keep
+    their network and database waits overlapped.
+    """
+
+    def __init__(
+        self,
+        tavily=None,
+        search=None,
+        search_workers: int = SEARCH_CONCURRENCY,
+        fetch_workers: int = FETCH_CONCURRENCY,
+        llm_workers: int = LLM_CONCURRENCY,
+        db_workers: int = DB_CONCURRENCY,
+        queue_size: int = PIPELINE_QUEUE_SIZE,
+        writer=None,
+        registry=None,
+    ):
+        # Searches go through the shared service (result cache, rate limit);
+        # passing a bare Tavily client wraps it in a service of its own.
+        if search is None:
+            search = SearchService(client=tavily) if tavily is not None else get_search_service()
+        self.search = search
+        self.limits = {
+            "search": max(1, search_workers),
+            "fetch": max(1, fetch_workers),
+            "extract": max(1, llm_workers),
+            "write": max(1, db_workers),
+        }
+        self.queue_size = max(1, queue_size)
+        # Anything with add(record) and flush(); defaults to the shared
+        # buffered DB writer so every engine's records land in the same batches.
+        self.writer = writer if writer is not None else get_writer()
+        self.registry = registry if registry is not None else known_urls
+        self.stats = {}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, key, n=1):
+        with self._stats_lock:
+            self.stats[key] = self.stats.get(key, 0) + n
+
+    # Stage handlers run in the stage's thread pool and return the items to
+    # pass downstream.
+
+    def _search(self, item):
+        spec, query = item
+        logging.info("[%s] Searching: %s", spec.name, query)
+        self._count("searches")
+        try:
+            results = self.search.search(query, max_results=spec.max_results, engine=spec.name)
+        except Exception:
+            logging.exception("Tavily search failed for query: %s", query)
+            self._count("search_errors")
+            return []
+        out = []
+        for r in results.get("results", []):
+            url = r.get("url")
+            if not url:
+                continue
+            # Skip pages already stored (or queued earlier in this run) before
+            # spending a scrape or an LLM call on them.
+            if not self.registry.claim(spec.source_type, url):
+                logging.debug("[%s] Already known, skipping: %s", spec.name, url)
+                self._count("known_skipped")
+                continue
+            out.append((spec, r))
+        return out
+
+    def _fetch(self, item):
+        spec, result = item
+        text = spec.fetch(result)
+        if not text:
+            return []
+        self._count("pages")
+        return [(spec, result["url"], text)]
+
+    def _extract(self, item):
+        spec, url, text = item
+        try:
+            record = spec.extract(text, url)
+        except Exception:
+            logging.exception("Extraction failed for %s", url)
+            self._count("extract_errors")
+            return []
+        self._count("extracted")
+        if not spec.accept(record):
+            logging.debug("[%s] Record for %s not accepted; skipping.", spec.name, url)
+            return []
+        return [record]
+
+    def _write(self, record):
+        try:
+            self.writer.add(record)
+        except Exception:
+            logging.exception("Failed to store record for %s", record.get("url"))
+            self._count("write_errors")
+            return []
+        self._count("stored")
+        logging.info(
+            "Queued for DB [%s]: %s",
+            record.get("source_type"),
+            record.get("title") or record.get("url"),
+        )
+        return []
+
+    async def _worker(self, name, inbox, outbox, handler, executor):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await inbox.get()
+            try:
+                outputs = await loop.run_in_executor(executor, handler, item)
+                if outbox is not None:
+                    for out in outputs:
+                        await outbox.put(out)
+            except Exception:
+                logging.exception("Pipeline %s stage failed", name)
+            finally:
+                inbox.task_done()
+
+    async def run(self, specs: List[EngineSpec]):
+        if not self.search.available:
+            logging.error("Tavily client unavailable; skipping search.")
+            return self.stats
+
+        stages = [
+            ("search", self._search),
+            ("fetch", self._fetch),
+            ("extract", self._extract),
+            ("write", self._write),
+        ]
+        queues = [asyncio.Queue(maxsize=self.queue_size) for _ in stages]
+        executors = []
+        workers = []
+        for i, (name, handler) in enumerate(stages):
+            limit = self.limits[name]
+            executor = ThreadPoolExecutor(max_workers=limit, thread_name_prefix=f"pipeline-{name}")
+            executors.append(executor)
+            outbox = queues[i + 1] if i + 1 < len(queues) else None
+            for _ in range(limit):
+                workers.append(
+                    asyncio.create_task(self._worker(name, queues[i], outbox, handler, executor))
+                )
+
+        start = time.monotonic()
+        self.search.reset_run()
+        try:
+            await asyncio.get_running_loop().run_in_executor(executors[0], self.registry.ensure_loaded)
+            # Interleave the engines' queries so every engine makes progress
+            # from the start rather than running one after another.
+            longest = max((len(s.queries) for s in specs), default=0)
+            for n in range(longest):
+                for spec in specs:
+                    if n < len(spec.queries):
+                        await queues[0].put((spec, spec.queries[n]))
+            # A stage's queue is drained only once everything upstream has
+            # finished putting into it, so join them in order.
+            for q in queues:
+                await q.join()
+            # Push out the writer's partial batch so callers (e.g. the CSV
+            # export) see every record once the pipeline returns.
+            await asyncio.get_running_loop().run_in_executor(executors[-1], self.writer.flush)
+        finally:
+            for w in workers:
+                w.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            for executor in executors:
+                executor.shutdown(wait=False)
+
+        elapsed = time.monotonic() - start
+        self.stats["elapsed_s"] = round(elapsed, 3)
+        pages = self.stats.get("pages", 0)
+        logging.info(
+            "Pipeline finished: %d searches, %d known skipped, %d pages, %d extracted, %d stored in %.1fs (%.1f pages/min)",
+            self.stats.get("searches", 0),
+            self.stats.get("known_skipped", 0),
+            pages,
+            self.stats.get("extracted", 0),
+            self.stats.get("stored", 0),
+            elapsed,
+            pages * 60.0 / elapsed if elapsed > 0 else 0.0,
+        )
+        logging.info("Search service: %s", self.search.stats())
+        return self.stats
+
+
+def run_pipeline(specs: List[EngineSpec], **kwargs):
+    """Run the given engine specs through one shared pipeline and return its stats."""
+    return asyncio.run(Pipeline(**kwargs).run(specs))
@@ -0,0 +1,205 @@
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from config import QA_INDEX_PATH, QA_SERVER_HOST, QA_SERVER_PORT, QA_RELOAD_INTERVAL
+from embed_index import InMemoryIndex, snapshot_generation
+from llama_qa import LlamaQA
+
+
+class QAService:
+    """A loaded index and LlamaQA, reloaded when the saved index changes.
+
+    Requests take the current `qa` reference and use it without locking;
+    a reload builds a complete new index beside it (sharing the embedding
+    model) and swaps the reference, so in-flight requests finish on the old
+    one. Memory-mapped files stay valid because `InMemoryIndex.save`
+    replaces files by rename. Only complete snapshots are loaded (see
+    `embed_index.snapshot_generation`); a load that fails or overlaps a
+    save is retried on the next tick.
+    """
+
+    def __init__(self, path: str = QA_INDEX_PATH, reload_interval: float = QA_RELOAD_INTERVAL):
+        self.path = path
+        self.reload_interval = reload_interval
+        self.qa = None
+        self.loaded_at = None
+        self.reloads = 0
+        self._signature = None
+        self._stop = threading.Event()
+        self._watcher = None
+        self._load()
+
+    def _disk_signature(self):
+        """The snapshot's generation and the state of its append log; None
+        while a save is in progress."""
+        generation = snapshot_generation(self.path)
+        if generation is None:
+            return None
+        sig = [generation]
+        for ext in (".log.jsonl", ".log.f32"):
+            try:
+                st = os.stat(self.path + ext)
+                sig.append((st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                sig.append(None)
+        return tuple(sig)
+
+    def _load(self):
+        sig = self._disk_signature()
+        if sig is None:
+            raise RuntimeError("%s is incomplete (a save is in progress)" % self.path)
+        model = self.qa.index.model if self.qa is not None else None
+        index = InMemoryIndex(model=model)
+        index.load(self.path)
+        if self._disk_signature() != sig:
+            # a save started while we were reading; the next tick tries again
+            raise RuntimeError("%s changed while loading" % self.path)
+        self.qa = LlamaQA(index)
+        self._signature = sig
+        self.loaded_at = time.time()
+        logging.info("QA server loaded %s (%d chunks)", self.path, len(index.chunk_ids))
+
+    def start_watching(self):
+        self._watcher = threading.Thread(target=self._watch, name="qa-index-watcher", daemon=True)
+        self._watcher.start()
+
+    def _watch(self):
+        seen = self._signature
+        while not self._stop.wait(self.reload_interval):
+            sig = self._disk_signature()
+            # Reload only a complete snapshot (see snapshot_generation) whose
+            # log has stopped changing for one interval.
+            if sig is not None and sig != self._signature and sig == seen:
+                try:
+                    self._load()
+                    self.reloads += 1
+                except Exception:
+                    # the signature is left as is, so the next tick tries again
+                    logging.exception("Reloading %s failed; keeping the previous index", self.path)
+            seen = sig
+
+    def stop(self):
+        self._stop.set()
+
+    def status(self):
+        index = self.qa.index
+        return {
+            "index": self.path,
+            "chunks": len(index.chunk_ids),
+            "docs": len(index.docs),
+            "loaded_at": self.loaded_at,
+            "reloads": self.reloads,
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    service: QAService = None
+
+    def log_message(self, fmt, *args):
+        logging.debug("qa_server: " + fmt, *args)
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, self.service.status())
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        self._streaming = False
+        try:
+            req = self._read_json()
+        except ValueError:
+            self._send_json(400, {"error": "invalid JSON"})
+            return
+        qa = self.service.qa
+        try:
+            if not isinstance(req, dict):
+                raise TypeError("request body must be a JSON object")
+            top_k = int(req.get("top_k", 3))
+            if self.path == "/query":
+                results = qa.index.query_batch(req["questions"], top_k=top_k, hybrid=bool(req.get("hybrid", True)))
+                self._send_json(200, {"results": results})
+            elif self.path == "/answer" and req.get("stream"):
+                self._stream(qa.answer_stream(req["question"], top_k=top_k))
+            elif self.path == "/answer":
+                self._send_json(200, {"answer": qa.answer(req["question"], top_k=top_k)})
+            elif self.path == "/answer_many":
+                self._send_json(200, {"answers": qa.answer_many(req["questions"], top_k=top_k)})
+            else:
+                self._send_json(404, {"error": "not found"})
+        except Exception as e:
+            if self._streaming:
+                # the status line is already sent; dropping the connection ends the response
+                logging.exception("qa_server: %s failed while streaming", self.path)
+                self.close_connection = True
+            elif isinstance(e, KeyError):
+                self._send_json(400, {"error": "missing field %s" % e})
+            elif isinstance(e, (ValueError, TypeError)):
+                self._send_json(400, {"error": "invalid request: %s" % e})
+            else:
+                logging.exception("qa_server: %s failed", self.path)
+                self._send_json(500, {"error": "internal error"})
+
+    def _stream(self, pieces):
+        # `pieces` is lazy: take the first one before the status line, so
+        # retrieval and validation errors still get a 400/500 response
+        pieces = iter(pieces)
+        first = next(pieces, None)
+        self._streaming = True
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        if first is not None:
+            for piece in itertools.chain([first], pieces):
+                data = piece.encode("utf-8")
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def serve(path: str = QA_INDEX_PATH, host: str = QA_SERVER_HOST, port: int = QA_SERVER_PORT):
+    """Load the index once and answer HTTP requests until interrupted.
+
+    GET /health; POST /query {"questions", "top_k", "hybrid"};
+    POST /answer {"question", "top_k", "stream"}; POST /answer_many {"questions", "top_k"}.
+    """
+    service = QAService(path)
+    service.start_watching()
+    handler = type("QAHandler", (_Handler,), {"service": service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    logging.info("QA server listening on http://%s:%d", host, port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stop()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    # python qa_server.py [index_path]
+    import sys
+
+    logging.basicConfig(level=logging.INFO)
+    serve(sys.argv[1] if len(sys.argv) > 1 else QA_INDEX_PATH)
@@ -1,14 +1,10 @@
 
 
-import pandas as pd
-from db import get_connection
+import report_generator
 
 def export_csv():
-    conn = get_connection()
-    df = pd.read_sql("SELECT * FROM intelligence;", conn)
-    df.to_csv("cordyceps_full_report.csv", index=False)
-    conn.close()
-    print("Exported to cordyceps_full_report.csv")
+    report_generator.export_csv(report_generator.DEFAULT_REPORT_PATH)
+    print("Exported to %s" % report_generator.DEFAULT_REPORT_PATH)
 
 def generate_queries(product):
     return [
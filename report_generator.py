@@ -1,11 +1,174 @@
-import pandas as pd
-from db import get_connection
+import json
+import logging
+import os
 
+from config import EXPORT_BATCH_SIZE
+from db import READ_COLUMNS, pooled_connection
+import metrics
 
-def export_csv(output_path="cordyceps_full_report.csv"):
-    conn = get_connection()
+DEFAULT_REPORT_PATH = "cordyceps_full_report.csv"
+
+# The fixed columns, then the full engine record as JSON text.
+_SELECT = "SELECT %s, payload::text AS payload FROM intelligence WHERE %%s ORDER BY id" % (", ".join(READ_COLUMNS))
+
+
+# Incremental exports go by `write_txid`, the id of the transaction that last
+# wrote a row (db._init_write_txid), not by `id`: a SERIAL id is taken when
+# a row is inserted, so a row can commit after a higher id has already been
+# exported. Each export takes the horizon below which every transaction has
+# finished, exports the rows written between the previous horizon and this
+# one, and keeps the new horizon in a sidecar file next to the output.
+# Rows written at or after the horizon wait for the next export. Upserts
+# restamp `write_txid`, so updated rows are exported again.
+
+
+def _watermark_path(output_path):
+    return output_path + ".watermark.json"
+
+
+def read_watermark(output_path):
+    """The sidecar of the last incremental export to `output_path` ({} if none).
+
+    {"txid": horizon}, or {"last_id": n} from before exports used horizons.
+    """
+    try:
+        with open(_watermark_path(output_path), "r", encoding="utf-8") as f:
+            mark = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return mark if isinstance(mark, dict) else {}
+
+
+def _write_watermark(output_path, horizon):
+    path = _watermark_path(output_path)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"txid": horizon}, f)
+    os.replace(tmp, path)
+
+
+def _discard(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _export_range(cur, incremental, output_path):
+    """(where, params, horizon): the rows to export; horizon is None for a full export."""
+    if not incremental:
+        return "TRUE", (), None
+    # Every transaction with a lower id has committed or aborted.
+    cur.execute("SELECT txid_snapshot_xmin(txid_current_snapshot());")
+    horizon = cur.fetchone()[0]
+    mark = read_watermark(output_path)
+    if "txid" in mark:
+        return "write_txid >= %s AND write_txid < %s", (int(mark["txid"]), horizon), horizon
+    # First export by horizon: rows from before write_txid existed go by id.
+    last_id = int(mark.get("last_id", 0))
+    return "(write_txid IS NULL AND id > %s) OR write_txid < %s", (last_id, horizon), horizon
+
+
+def export_csv(output_path=DEFAULT_REPORT_PATH, incremental=False):
+    """Stream the intelligence table to CSV with COPY ... TO STDOUT.
+
+    Rows go from the server straight to the file, so memory stays flat
+    however large the table is. With `incremental=True` only rows added or
+    updated since the last incremental export to `output_path` are written
+    (the file then holds just those rows). The file is replaced atomically
+    and the watermark advanced only once it is complete. Returns the row
+    count.
+    """
+    tmp = output_path + ".tmp"
+    try:
+        with metrics.timer("export"), pooled_connection() as conn:
+            with conn.cursor() as cur:
+                where, params, horizon = _export_range(cur, incremental, output_path)
+                sql = cur.mogrify(
+                    "COPY (%s) TO STDOUT WITH (FORMAT csv, HEADER true)" % (_SELECT % where),
+                    params,
+                ).decode()
+                with open(tmp, "w", encoding="utf-8", newline="") as f:
+                    cur.copy_expert(sql, f)
+                rows = max(cur.rowcount, 0)
+    except Exception:
+        _discard(tmp)
+        raise
+    os.replace(tmp, output_path)
+    if incremental:
+        _write_watermark(output_path, horizon)
+    metrics.inc("export_rows", rows)
+    logging.info("Exported %d intelligence rows to %s", rows, output_path)
+    return rows
+
+
+def export_parquet(output_path="cordyceps_full_report.parquet", incremental=False, batch_size=EXPORT_BATCH_SIZE):
+    """Stream the intelligence table to Parquet through a server-side cursor.
+
+    Rows are fetched `batch_size` at a time and each batch is written as a
+    row group, so at most one batch is in memory. Incremental mode works as
+    in `export_csv`. Needs pyarrow. Returns the row count.
+    """
     try:
-        df = pd.read_sql("SELECT * FROM intelligence;", conn)
-        df.to_csv(output_path, index=False)
-    finally:
-        conn.close()
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+
+    tmp = output_path + ".tmp"
+    rows = 0
+    writer = None
+    try:
+        with metrics.timer("export"), pooled_connection() as conn:
+            with conn.cursor() as cur:
+                where, params, horizon = _export_range(cur, incremental, output_path)
+            # A named cursor keeps the result set on the server; each
+            # fetchmany pulls one batch.
+            with conn.cursor(name="intelligence_export") as cur:
+                cur.execute(_SELECT % where, params)
+                while True:
+                    batch = cur.fetchmany(batch_size)
+                    if writer is None:
+                        names = [d[0] for d in cur.description]
+                        schema = pa.schema([(n, pa.int64() if n == "id" else pa.string()) for n in names])
+                        writer = pq.ParquetWriter(tmp, schema)
+                    if not batch:
+                        break
+                    columns = list(zip(*batch))
+                    writer.write_batch(
+                        pa.RecordBatch.from_arrays(
+                            [pa.array(col, type=field.type) for col, field in zip(columns, schema)],
+                            schema=schema,
+                        )
+                    )
+                    rows += len(batch)
+        writer.close()
+    except Exception:
+        if writer is not None:
+            writer.close()
+        _discard(tmp)
+        raise
+    os.replace(tmp, output_path)
+    if incremental:
+        _write_watermark(output_path, horizon)
+    metrics.inc("export_rows", rows)
+    logging.info("Exported %d intelligence rows to %s", rows, output_path)
+    return rows
+
+
+def export_report(output_path=DEFAULT_REPORT_PATH, incremental=False):
+    """Export as Parquet when `output_path` ends in .parquet, else as CSV."""
+    if output_path.endswith(".parquet"):
+        return export_parquet(output_path, incremental=incremental)
+    return export_csv(output_path, incremental=incremental)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export the intelligence table.")
+    parser.add_argument("output", nargs="?", default=DEFAULT_REPORT_PATH, help="CSV or .parquet path")
+    parser.add_argument("--incremental", action="store_true", help="only rows added or updated since the last incremental export")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    export_report(args.output, incremental=args.incremental)
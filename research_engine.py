@@ -1,10 +1,12 @@
 import json
 import re
 import logging
-import ollama
-from config import OLLAMA_MODEL
+from llm_cache import cached_chat
 from pdf_pipeline import find_pdf_links, download_pdfs
 
+# Bump when the extract_structured prompt changes to invalidate cached replies.
+PROMPT_VERSION = "paper-v1"
+
 
 def generate_queries(product):
     return [
@@ -21,13 +23,17 @@ def clean_json(text):
     return match.group(0) if match else "{}"
 
 
-def auto_download_pdfs(html, base_url):
-    """Find and download PDFs from HTML page."""
+def auto_download_pdfs(html, base_url, pdf_links=None):
+    """Find and download PDFs from HTML page.
+
+    Pass `pdf_links` when the page has already been parsed (see `main.scrape`).
+    """
     try:
-        pdf_links = find_pdf_links(html, base_url)
+        if pdf_links is None:
+            pdf_links = find_pdf_links(html, base_url)
         if pdf_links:
             logging.info("Found %d PDF links on %s", len(pdf_links), base_url)
-            downloaded = download_pdfs(pdf_links, out_dir="pdfs/research")
+            downloaded = download_pdfs(pdf_links, tag="research")
             if downloaded:
                 logging.info("Downloaded %d PDFs from research page", len(downloaded))
             else:
@@ -57,11 +63,7 @@ Return JSON:
 }
 """ % url
 
-    response = ollama.chat(
-        model=OLLAMA_MODEL, messages=[{"role": "user", "content": prompt + text[:4000]}]
-    )
-
-    content = response.get("message", {}).get("content", "")
+    content = cached_chat(PROMPT_VERSION, prompt, text[:4000])
     try:
         data = json.loads(content)
     except Exception:
@@ -84,5 +86,7 @@ Return JSON:
     ]
     for k in keys:
         data.setdefault(k, "")
+    # (source_type, url) identifies the stored row
+    data["source_type"] = "paper"
     data["url"] = url
     return data
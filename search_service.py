@@ -0,0 +1,214 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+from tavily import TavilyClient
+from config import (
+    TAVILY_API_KEY,
+    TAVILY_BASE_URL,
+    SEARCH_CACHE_PATH,
+    SEARCH_CACHE_TTL,
+    SEARCH_RATE,
+    SEARCH_BURST,
+)
+import metrics
+
+_PUNCT_RE = re.compile(r"[^\w\s.$%/-]+")
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase, drop punctuation that does not change a web search, collapse whitespace."""
+    return " ".join(_PUNCT_RE.sub(" ", query.lower()).split())
+
+
+class TokenBucket:
+    """Allow `rate` acquisitions per second on average, up to `burst` at once."""
+
+    def __init__(self, rate: float = SEARCH_RATE, burst: int = SEARCH_BURST):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class SearchCache:
+    """SQLite cache of search responses keyed by normalised query.
+
+    A response fetched with `max_results = n` answers later requests for
+    up to n results. Entries older than `ttl` seconds are ignored and
+    purged on open.
+    """
+
+    def __init__(self, path: str = SEARCH_CACHE_PATH, ttl: float = SEARCH_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS searches (
+                    query TEXT PRIMARY KEY,
+                    max_results INTEGER NOT NULL,
+                    response TEXT NOT NULL,
+                    fetched_at REAL NOT NULL
+                )"""
+            )
+            self._db.execute("DELETE FROM searches WHERE fetched_at < ?", (time.time() - ttl,))
+
+    def get(self, query, max_results):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT max_results, response, fetched_at FROM searches WHERE query = ?", (query,)
+            ).fetchone()
+        if row is None or row[0] < max_results or time.time() - row[2] > self.ttl:
+            return None
+        response = json.loads(row[1])
+        response["results"] = response.get("results", [])[:max_results]
+        return response
+
+    def put(self, query, max_results, response):
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO searches (query, max_results, response, fetched_at) VALUES (?, ?, ?, ?)",
+                (query, max_results, json.dumps(response), time.time()),
+            )
+
+
+class SearchService:
+    """One Tavily entry point for every engine.
+
+    Responses are cached per normalised query (see `SearchCache`), identical
+    queries in flight at the same time share one API call, and API calls go
+    through a token bucket so concurrent searches stay under Tavily's rate
+    limit. Result URLs are tracked per run: `stats()["duplicate_urls"]`
+    counts results another engine had already been given. Those are still
+    returned: each engine stores its own `(source_type, url)` record, so a
+    URL found by research and vendor search yields two different rows. Only
+    the research engine fetches pages; market and vendor engines extract
+    from the Tavily snippet, so a shared URL costs no extra fetch.
+    """
+
+    def __init__(self, client=None, cache=None, bucket=None):
+        if client is None and TAVILY_API_KEY:
+            kwargs = {"api_base_url": TAVILY_BASE_URL} if TAVILY_BASE_URL else {}
+            client = TavilyClient(api_key=TAVILY_API_KEY, **kwargs)
+        self.client = client
+        self.cache = cache if cache is not None else SearchCache()
+        self.bucket = bucket if bucket is not None else TokenBucket()
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._url_engine = {}
+        self._counts = {"hits": 0, "misses": 0, "api_calls": 0, "coalesced": 0, "duplicate_urls": 0}
+
+    @property
+    def available(self):
+        return self.client is not None
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self._counts[key] += n
+
+    def search(self, query: str, max_results: int = 5, engine: str = None) -> dict:
+        """Tavily-shaped response ({"results": [...]}) for `query`."""
+        key = normalize_query(query)
+        response = self.cache.get(key, max_results)
+        if response is not None:
+            self._count("hits")
+            metrics.inc("search_cache_hits")
+        else:
+            self._count("misses")
+            metrics.inc("search_cache_misses")
+            response = self._fetch(key, query, max_results)
+        self._track_urls(response, engine)
+        return response
+
+    def _fetch(self, key, query, max_results):
+        with self._lock:
+            fut = self._inflight.get((key, max_results))
+            owner = fut is None
+            if owner:
+                fut = self._inflight[(key, max_results)] = Future()
+            else:
+                self._counts["coalesced"] += 1
+        if not owner:
+            return fut.result()
+        try:
+            # a call for the same query may have finished since our cache miss
+            response = self.cache.get(key, max_results)
+            if response is not None:
+                fut.set_result(response)
+                return response
+            self.bucket.acquire()
+            self._count("api_calls")
+            with metrics.timer("search"):
+                response = self.client.search(query=query, max_results=max_results)
+            self.cache.put(key, max_results, response)
+            fut.set_result(response)
+            return response
+        except Exception as e:
+            fut.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[(key, max_results)]
+
+    def _track_urls(self, response, engine):
+        dup = 0
+        with self._lock:
+            for r in response.get("results", []):
+                url = r.get("url")
+                if not url:
+                    continue
+                first = self._url_engine.setdefault(url, engine)
+                if first != engine:
+                    dup += 1
+            self._counts["duplicate_urls"] += dup
+
+    def reset_run(self):
+        """Forget which engine saw which URL (start of a new run)."""
+        with self._lock:
+            self._url_engine.clear()
+
+    def stats(self):
+        with self._lock:
+            out = dict(self._counts)
+            out["urls"] = len(self._url_engine)
+        lookups = out["hits"] + out["misses"]
+        out["hit_rate"] = round(out["hits"] / lookups, 3) if lookups else 0.0
+        return out
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_search_service():
+    """Return the search service shared by every engine."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = SearchService()
+        return _service
@@ -1,11 +1,13 @@
 import logging
 import json
 import re
-from tavily import TavilyClient
-from config import TAVILY_API_KEY, OLLAMA_MODEL
-import ollama
-from db import insert_intelligence
+from config import TAVILY_API_KEY
+from llm_cache import cached_chat
 from pdf_pipeline import find_pdf_links, download_pdfs
+from pipeline import EngineSpec, run_pipeline
+
+# Bump when the extract_vendor_intelligence prompt changes.
+PROMPT_VERSION = "vendor-v1"
 
 
 def generate_vendor_queries(product):
@@ -52,10 +54,7 @@ Only include fields you can confidently extract. If not mentioned, leave blank.
 """ % url
 
     try:
-        response = ollama.chat(
-            model=OLLAMA_MODEL, messages=[{"role": "user", "content": prompt + text[:5000]}]
-        )
-        content = response.get("message", {}).get("content", "")
+        content = cached_chat(PROMPT_VERSION, prompt, text[:5000])
         try:
             data = json.loads(content)
         except Exception:
@@ -83,59 +82,62 @@ Only include fields you can confidently extract. If not mentioned, leave blank.
     }
     for k, v in defaults.items():
         data.setdefault(k, v)
+    # (source_type, url) identifies the stored row
+    data["source_type"] = "vendor"
+    data["url"] = url
     return data
 
 
+def fetch_vendor_content(result):
+    """Use the Tavily snippet as page content and download any PDFs it links."""
+    url = result.get("url", "")
+    content = result.get("content", "")
+
+    if not content:
+        logging.warning("No content for vendor URL: %s", url)
+        return None
+
+    # Auto-download PDFs from vendor page
+    try:
+        pdf_links = find_pdf_links(content, url)
+        if pdf_links:
+            logging.info("Found %d PDF links on vendor page %s", len(pdf_links), url)
+            downloaded = download_pdfs(pdf_links, tag="vendors")
+            if downloaded:
+                logging.info("Downloaded %d PDFs from vendor page", len(downloaded))
+            else:
+                logging.warning("Failed to download PDFs from vendor page %s", url)
+        else:
+            logging.debug("No PDF links found on vendor page: %s", url)
+    except Exception:
+        logging.exception("Failed to download PDFs from vendor page %s", url)
+    return content
+
+
+def has_vendor_data(vendor_intel):
+    # Insert if we found vendor contact or pricing info
+    return bool(
+        vendor_intel.get("vendor_name") or vendor_intel.get("contact_email") or vendor_intel.get("price")
+    )
+
+
+def vendor_spec(product):
+    """Pipeline spec for vendor/supplier research."""
+    return EngineSpec(
+        name="vendor",
+        source_type="vendor",
+        queries=generate_vendor_queries(product),
+        max_results=4,
+        fetch=fetch_vendor_content,
+        extract=extract_vendor_intelligence,
+        accept=has_vendor_data,
+    )
+
+
 def run_vendor_research(product):
     """Run vendor/supplier intelligence research and store in DB."""
     if not TAVILY_API_KEY:
         logging.warning("TAVILY_API_KEY not set; skipping vendor research.")
         return
 
-    tavily = TavilyClient(api_key=TAVILY_API_KEY)
-    queries = generate_vendor_queries(product)
-
-    for query in queries:
-        logging.info("Vendor search: %s", query)
-        try:
-            results = tavily.search(query=query, max_results=4)
-        except Exception:
-            logging.exception("Tavily search failed for query: %s", query)
-            continue
-
-        for r in results.get("results", []):
-            url = r.get("url", "")
-            content = r.get("content", "")
-
-            if not content:
-                logging.warning("No content for vendor URL: %s", url)
-                continue
-
-            try:
-                vendor_intel = extract_vendor_intelligence(content, url)
-                
-                # Insert if we found vendor contact or pricing info
-                if vendor_intel.get("vendor_name") or vendor_intel.get("contact_email") or vendor_intel.get("price"):
-                    insert_intelligence(vendor_intel)
-                    logging.info(
-                        "Inserted vendor intel: %s from %s",
-                        vendor_intel.get("vendor_name", "Unknown"),
-                        vendor_intel.get("country", "Unknown"),
-                    )
-                
-                # Auto-download PDFs from vendor page
-                try:
-                    pdf_links = find_pdf_links(content, url)
-                    if pdf_links:
-                        logging.info("Found %d PDF links on vendor page %s", len(pdf_links), url)
-                        downloaded = download_pdfs(pdf_links, out_dir="pdfs/vendors")
-                        if downloaded:
-                            logging.info("Downloaded %d PDFs from vendor page", len(downloaded))
-                        else:
-                            logging.warning("Failed to download PDFs from vendor page %s", url)
-                    else:
-                        logging.debug("No PDF links found on vendor page: %s", url)
-                except Exception:
-                    logging.exception("Failed to download PDFs from vendor page %s", url)
-            except Exception:
-                logging.exception("Failed to process vendor data from %s", url)
+    return run_pipeline([vendor_spec(product)])